@@ -8,6 +8,7 @@ import epitran
 import sys, json, glob, os, math
 from copy import deepcopy
 from morpar import *
+from translit import Transliterator
 import nltk
 from nltk.probability import *
 try:
@@ -45,18 +46,20 @@ def log_error(*args, **kwargs):
 #
 ######################################
 
-@memoized
+@memoized(maxsize=None)    # loaded once
 def get_freq_dist():
     freq = FreqDist()
     freq.update(brown.words())
     return freq
 
-@memoized
+# Passes every word to Epitran until get_dictionary() has verified its
+# transliteration table on the lexicon; see translit.py.
+@memoized(maxsize=None)    # loaded once
 def get_g2p(lang):
     epi = epitran.Epitran(lang)
-    return epi.trans_delimiter
+    return Transliterator(epi.trans_delimiter)
 
-@memoized
+@memoized(maxsize=None)    # loaded once
 def get_dictionary(dict_directory, lookup_node='LEMMA', definition_node='GLOSS'):
     l1_to_l2 = defaultdict(list)
     l2_to_l1 = defaultdict(list)
@@ -76,6 +79,7 @@ def get_dictionary(dict_directory, lookup_node='LEMMA', definition_node='GLOSS')
                     subdef = subdef.strip()
                     l1_to_l2[ipa].append(subdef)
                     l2_to_l1[subdef].append(ipa) 
+    g2p.verify()
     return l1_to_l2
     
 class Lookup(Parser):
@@ -120,6 +124,53 @@ class Lookup(Parser):
                 results.add((output2,remnant))
         return results
     
+class GuessLookup(Parser):
+    ''' Does the work of Lookup(Guess(guess_channel), ...), but without trying
+        every split of the text.  It has to be the last thing parsed (see LOOKUP_ROOT):
+        then a stem shorter than the text would leave a remnant that nothing else
+        could parse, so the only stem tried is the whole text, with its definitions
+        if it's in the dictionary, or else guessed at a cost of 50 plus its length,
+        as in Lookup. '''
+
+    def __init__(self, guess_channel, directory, channel=None, output_channel=None):
+        super(GuessLookup, self).__init__(guess_channel)
+        self.dictionary = get_dictionary(directory)
+        self.lookup_channel = channel
+        self.output_channel = output_channel
+
+    @memoized
+    def __call__(self, input, input_channel=None, leftward=False):
+        return super(GuessLookup, self).__call__(input, input_channel, leftward)
+
+    def _nontrivial_parse(self, input, input_channel=None, leftward=False):
+        assert(len(input_channel)==1)
+        results = set()
+        text = input[input_channel.name]
+        if not text:
+            return results
+
+        remnant = HashableDict(input)
+        remnant[input_channel.name] = input_channel.typ("")    # the whole text is the stem
+        output = HashableDict()
+        for output_channel in self.channel:
+            if output_channel != input_channel:
+                output[output_channel.name] = output_channel.typ(text)
+        key = output[self.lookup_channel.name].strip()
+        if key in self.dictionary:
+            for definition in self.dictionary[key]:
+                output2 = HashableDict(output)
+                for channel in self.output_channel:
+                    output2[channel.name] = channel.typ(definition)
+                output2[Cost.name] = Cost.typ("")    # as in Lookup, definitions cost nothing
+                results.add((output2, remnant))
+        else:
+            output2 = HashableDict(output)
+            for channel in self.output_channel:
+                output2[channel.name] = channel.typ(key.replace(" ",""))
+            output2[Cost.name] = Cost.typ("X" * (50 + len(key)))
+            results.add((output2, remnant))
+        return results
+
 ###############################
 #
 # MORPHOLOGICAL GRAMMAR
@@ -195,7 +246,9 @@ CASE = (
 )
 
 ROOT        = Guess(Lem)
-LOOKUP_ROOT = Lookup(ROOT, ".", Def, Def & Nat)
+# = Lookup(ROOT, ".", Def, Def & Nat), only faster, as long as nothing is parsed after it:
+# it only tries the whole of what's left of the word as a stem (see GuessLookup)
+LOOKUP_ROOT = GuessLookup(Lem, ".", Def, Def & Nat)
 WORD        = LOOKUP_ROOT << NUMBER << DEFINITENESS << POSS << CASE
 PHONWORD    = WORD << ENCLITIC
 PARSER      = PREP >> PHONWORD
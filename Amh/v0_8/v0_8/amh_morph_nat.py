@@ -45,18 +45,18 @@ def log_error(*args, **kwargs):
 #
 ######################################
 
-@memoized
+@memoized(maxsize=None)    # loaded once
 def get_freq_dist():
     freq = FreqDist()
     freq.update(brown.words())
     return freq
 
-@memoized
+@memoized(maxsize=None)    # loaded once
 def get_g2p(lang):
     epi = epitran.Epitran(lang)
     return epi.trans_delimiter
 
-@memoized
+@memoized(maxsize=None)    # loaded once
 def get_dictionary(dict_directory, lookup_node='LEMMA', definition_node='GLOSS'):
     l1_to_l2 = defaultdict(list)
     l2_to_l1 = defaultdict(list)
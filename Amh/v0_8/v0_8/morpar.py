@@ -2,7 +2,7 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import unicode_literals
-import re, collections, functools, json
+import re, collections, functools, json, time
 from copy import deepcopy
 from argparse import Namespace
 
@@ -15,22 +15,55 @@ from argparse import Namespace
 class memoized(object):
    '''Decorator. Caches a function's return value each time it is called.
    If called later with the same arguments, the cached value is returned
-   (not reevaluated).
+   (not reevaluated).  The cache keeps at most maxsize values, evicting the
+   least recently used one when it's full (maxsize=None means no limit, for
+   things like dictionaries that should only be loaded once), and if ttl is
+   given, values older than ttl seconds are recomputed.  Use it bare
+   (@memoized) for the defaults, or with arguments (@memoized(maxsize=None)).
+   cache_info() reports on one cache; memoized.report() on all of them.
    '''
-   def __init__(self, func):
+   instances = []
+   
+   def __init__(self, func=None, maxsize=10000, ttl=None):
       self.func = func
-      self.cache = {}
+      self.maxsize = maxsize
+      self.ttl = ttl
+      self.cache = collections.OrderedDict()
+      self.hits = self.misses = self.evictions = self.expirations = 0
+      memoized.instances.append(self)
    def __call__(self, *args):
+      if self.func is None:   # used with arguments; this call is the decoration
+         self.func = args[0]
+         return self
       #if not isinstance(args, collections.Hashable):
          # uncacheable. a list, for instance.
          # better to not cache than blow up.
          # return self.func(*args)
       if args in self.cache:
-         return self.cache[args]
-      else:
-         value = self.func(*args)
-         self.cache[args] = value
-         return value
+         value, timestamp = self.cache.pop(args)
+         if self.ttl is None or time.time() - timestamp < self.ttl:
+            self.hits += 1
+            self.cache[args] = (value, timestamp)   # now the most recently used
+            return value
+         self.expirations += 1
+      self.misses += 1
+      value = self.func(*args)
+      self.cache[args] = (value, time.time())
+      if self.maxsize is not None and len(self.cache) > self.maxsize:
+         self.cache.popitem(last=False)
+         self.evictions += 1
+      return value
+   def cache_info(self):
+      return { "name": getattr(self.func, "__name__", repr(self.func)),
+               "hits": self.hits, "misses": self.misses, 
+               "evictions": self.evictions, "expirations": self.expirations,
+               "size": len(self.cache), "maxsize": self.maxsize, "ttl": self.ttl }
+   def cache_clear(self):
+      self.cache.clear()
+   @staticmethod
+   def report():
+      '''Return the cache_info() of every memoized function.'''
+      return [m.cache_info() for m in memoized.instances if m.func is not None]
    def __repr__(self):
       '''Return the function's docstring.'''
       return self.func.__doc__
@@ -219,6 +252,21 @@ class AbstractStr(unicode):
 
     def is_pattern(self):
         return self[:1] == '/' and self[-1:] == '/'
+
+    def split_points(self, leftward=False):
+        ''' The offsets at which Guess can split this string into a stem at the start (if 
+            leftward) or the end (if not) and an affix: every offset, if there's no delimiter,
+            or else only those next to one, since the stem has to be delimited from the rest. 
+            (With Spaced IPA, as from Epitran's trans_delimiter, those are the boundaries 
+            between segments.) '''
+        delim = self.delimiter()
+        if not delim:
+            return range(1, len(self) + 1) if leftward else range(len(self))
+        if not self:
+            return []
+        if leftward:
+            return [ i for i in range(1, len(self)) if self.startswith(delim, i) ] + [len(self)]
+        return [0] + [ i + len(delim) for i in range(len(self) - len(delim)) if self.startswith(delim, i) ]
         
     def replacePattern(self, input):
         # self is the pattern, input is what goes into it
@@ -361,9 +409,9 @@ class Guess(Parser):
         hasAffix = text.hasPrefix if leftward else text.hasSuffix
         stripAffix = text.stripPrefix if leftward else text.stripSuffix
                 
-        for i in range(len(text)):
+        for i in text.split_points(leftward):
             remnant = deepcopy(input)
-            substr = text[:i+1] if leftward else text[i:]
+            substr = text[:i] if leftward else text[i:]
             stem = input_channel.typ(substr)
             if hasAffix(stem):
                 remnant[input_channel.name] = stripAffix(stem)
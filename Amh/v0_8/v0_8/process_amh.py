@@ -7,52 +7,81 @@ from io import open
 import argparse, glob, os
 from progressbar import ProgressBar, Bar, AdaptiveETA, Percentage
 from amh_morph import *
-import epitran
 
-g2p = epitran.Epitran("amh-Ethi").trans_delimiter
+g2p = get_g2p("amh-Ethi")
 
 def ensure_dir(mydir):
     if not os.path.isdir(mydir):
         os.makedirs(mydir)
 
+# The processing is a pipeline of generators, one line at a time, so that
+# memory use stays the same however large the input file is.
+
+FLUSH_EVERY = 1000   # lines
+
+def count_lines(filename):
+    with open(filename, 'rb') as fin:
+        return sum(1 for line in fin)
+
+def read_lines(filename):
+    with open(filename,'r',encoding="utf-8") as fin:
+        for line in fin:
+            yield line
+
+def tokenize(lines):
+    for line in lines:
+        yield line.rstrip("\n").split(" ")
+
+def transliterate(token_lines):
+    for tokens in token_lines:
+        yield g2p.transliterate_many(tokens)
+
+def best_parses(ipa_lines):
+    for ipas in ipa_lines:
+        parsed = []
+        for ipa in ipas:
+            output = list(PARSER.parse(ipa))
+            output.sort(key=lambda x:len(x["cost"]) if "cost" in x else 0)
+            parsed.append((output[0] if output else {}, ipa))
+        yield parsed
+
+def format_lines(parsed_lines):
+    for parsed in parsed_lines:
+        lemmas = []
+        gloss = []
+        for output, ipa in parsed:
+            if "lemma" not in output or not output["lemma"]:
+                lemmas.append(ipa)
+            else:
+                lemmas.append(output["lemma"].replace(" ",""))
+            if "gloss" not in output or not output["gloss"]:
+                gloss.append(ipa)
+            else:
+                parts = output["gloss"].replace(" ","").split("-")
+                gloss += parts
+        yield " ".join(lemmas) + "\n", " ".join(gloss) + "\n"
+
 def go(inputDir, outputDir):
     filenames = glob.glob(os.path.join(inputDir, "*.orig.amh"))
     for filename in filenames:
         print("Processing %s" % filename)
-            
-    
-        with open(filename,'r',encoding="utf-8") as fin:
-            basename = os.path.basename(filename).split(".")[0]
-            lemmaFilename = os.path.join(outputDir, basename + ".lemma.amh")
-            glossFilename = os.path.join(outputDir, basename + ".gloss.amh")
-            with open(lemmaFilename,'w', encoding="utf-8") as lemmaFout:
-                with open(glossFilename,'w', encoding="utf-8") as glossFout:
-                    lines = fin.readlines()
-                    bar = ProgressBar(maxval=len(lines), poll=1, widgets=[
-                        Bar('=', '[', ']'), ' ',
-                        Percentage(), ' ',
-                        AdaptiveETA()])
-                        
-                    for line in bar(lines):
-                        lemmas = []
-                        gloss = []
-                        for word in line.split(" "):
-                            ipa = g2p(word)
-                            output = list(PARSER.parse(ipa))
-                            output.sort(key=lambda x:len(x["cost"]) if "cost" in x else 0)
-                            output = output[0] if output else {}
-                            if "lemma" not in output or not output["lemma"]:
-                                lemmas.append(ipa)
-                            else:
-                                lemmas.append(output["lemma"].replace(" ",""))
-                            if "gloss" not in output or not output["gloss"]:
-                                gloss.append(ipa)
-                            else:
-                                parts = output["gloss"].replace(" ","").split("-")
-                                gloss += parts
-                        lemmaFout.write(" ".join(lemmas) + "\n")
-                        glossFout.write(" ".join(gloss) + "\n")
-                        
+        basename = os.path.basename(filename).split(".")[0]
+        lemmaFilename = os.path.join(outputDir, basename + ".lemma.amh")
+        glossFilename = os.path.join(outputDir, basename + ".gloss.amh")
+        with open(lemmaFilename,'w', encoding="utf-8") as lemmaFout:
+            with open(glossFilename,'w', encoding="utf-8") as glossFout:
+                bar = ProgressBar(maxval=count_lines(filename), poll=1, widgets=[
+                    Bar('=', '[', ']'), ' ',
+                    Percentage(), ' ',
+                    AdaptiveETA()])
+                lines = bar(read_lines(filename))
+                outputs = format_lines(best_parses(transliterate(tokenize(lines))))
+                for n, (lemmaLine, glossLine) in enumerate(outputs, 1):
+                    lemmaFout.write(lemmaLine)
+                    glossFout.write(glossLine)
+                    if n % FLUSH_EVERY == 0:
+                        lemmaFout.flush()
+                        glossFout.flush()
                         
 if __name__ == '__main__':
     argparser = argparse.ArgumentParser()
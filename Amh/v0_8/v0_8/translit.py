@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# A faster front end to an Epitran transliteration function (e.g.
+# Epitran("tir-Ethi").transliterate).  Most Ge'ez-script words transliterate
+# one syllable at a time, so a table of each syllable's transliteration, in the
+# middle of a word and at its end, gives the same result as Epitran for a
+# fraction of the cost.  Some don't: rules like the -pp schemes' ɨ deletion
+# depend on the neighbouring syllables.  So the table is only trusted once it
+# has been checked against Epitran on a list of words (the lexicon), and then
+# only for words made entirely of pairs of neighbouring syllables it got right
+# there; every other word is passed to Epitran.
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+ETHIOPIC = "".join(chr(i) if str is not bytes else unichr(i) for i in range(0x1200, 0x13A0))
+END = ""    # stands for the end of the word, in pairs of neighbouring syllables
+
+def syllable_pairs(word):
+    "The pairs of neighbouring syllables in a word, the last paired with END."
+    return list(zip(word, word[1:])) + [(word[-1], END)]
+
+class Transliterator(object):
+    ''' Transliterates like the given Epitran function, remembering the words it has
+        seen.  Before verify() is called (or a verified table is passed in), every new
+        word goes to Epitran; afterwards, only those the table can't be trusted with.
+
+        The table's state -- what verify() returns -- can be saved and passed to a later
+        Transliterator with the same Epitran scheme, so that it needn't be verified again. '''
+
+    PROBE = "ሀ"          # hə: the same in every position, and affects no neighbour
+    MEMO_SIZE = 100000   # words remembered, once verified
+
+    def __init__(self, transliterate, table=None, chars=ETHIOPIC):
+        self.epitran = transliterate
+        self.chars = chars
+        self.memo = {}
+        self.medial = None
+        self.final = None
+        self.safe = None      # pairs of neighbouring syllables the table gets right
+        self.table_hits = 0
+        self.fallbacks = 0
+        if table is not None:
+            self.set_table(table)
+
+    def set_table(self, table):
+        self.medial, self.final, self.safe = table
+        self.memo.clear()
+
+    def build_table(self):
+        ''' Works out each syllable's transliteration in the middle of a word, from that of
+            the syllable followed by the probe, and at the end of one, from that of the probe
+            followed by the syllable.  Syllables for which this doesn't work are left out. '''
+        probe = self.epitran(self.PROBE)
+        pair = self.epitran(self.PROBE * 2)
+        head = pair[:-len(probe)] if probe and pair.endswith(probe) else None
+        medial, final = {}, {}
+        if head:
+            for c in self.chars:
+                before, after = self.epitran(c + self.PROBE), self.epitran(self.PROBE + c)
+                if before.endswith(probe) and after.startswith(head):
+                    medial[c] = before[:-len(probe)]
+                    final[c] = after[len(head):]
+        return medial, final
+
+    def table_form(self, word, medial, final):
+        "The word's transliteration by the table, as a list of pieces, one per syllable; or None."
+        if len(word) < 2 or word[-1] not in final or any(c not in medial for c in word[:-1]):
+            return None
+        return [ medial[c] for c in word[:-1] ] + [ final[word[-1]] ]
+
+    def verify(self, words=()):
+        ''' Builds the table and checks it against Epitran on the given words and every
+            word transliterated so far (e.g. while building the lexicon), keeping the pairs
+            of neighbouring syllables that only occur where the two agree.  Where they
+            don't, the pairs from the first difference on are ruled out, so that the table
+            is never used for a word on which it was checked and found wrong.
+            Returns the table's state (see set_table()). '''
+        for word in words:
+            self(word)
+        medial, final = self.build_table()
+        seen, wrong = set(), set()
+        for word, expected in self.memo.items():
+            pieces = self.table_form(word, medial, final)
+            if pieces is None:
+                continue
+            pairs = syllable_pairs(word)
+            seen.update(pairs)
+            got = "".join(pieces)
+            if got == expected:
+                continue
+            diff = next((i for i, (a, b) in enumerate(zip(got, expected)) if a != b), min(len(got), len(expected)))
+            k, end = 0, len(pieces[0])
+            while end <= diff and k < len(pieces) - 1:
+                k += 1
+                end += len(pieces[k])
+            wrong.update(pairs[max(k - 1, 0):])
+        table = (medial, final, seen - wrong)
+        self.set_table(table)
+        return table
+
+    def __call__(self, word):
+        if word in self.memo:
+            return self.memo[word]
+        if self.safe is not None and len(word) > 1 and all(pair in self.safe for pair in syllable_pairs(word)):
+            self.table_hits += 1
+            result = "".join([ self.medial[c] for c in word[:-1] ]) + self.final[word[-1]]
+        else:
+            self.fallbacks += 1
+            result = self.epitran(word)
+        if self.safe is not None and len(self.memo) >= self.MEMO_SIZE:
+            self.memo.clear()
+        self.memo[word] = result
+        return result
+
+    def transliterate_many(self, words):
+        "A list of the words' transliterations, transliterating each distinct word once."
+        results = dict((word, self(word)) for word in set(words))
+        return [ results[word] for word in words ]
+
+    def reset_counters(self):
+        self.table_hits = self.fallbacks = 0
+
+    def stats(self):
+        return {"table": self.table_hits, "epitran": self.fallbacks,
+                "safe_pairs": len(self.safe) if self.safe is not None else 0}
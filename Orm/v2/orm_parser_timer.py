@@ -1,13 +1,12 @@
 import time
+from itertools import islice
 from orm_morph import *
 
 
 fi = open("/usr2/data/rmccoy/first2000.txt", "r")
 
-lines = fi.readlines()
-
 start = time.time()
-for line in lines[:10]:
+for line in islice(fi, 10):
 	parseNow = best_parse(line.strip(), "gloss")
 #	parses = parse(line.strip(), "gloss")
 #	
@@ -4,10 +4,8 @@ from orm_morph import *
 
 fi = open("/usr2/data/rmccoy/first2000.txt", "r")
 
-lines = fi.readlines()
-
 start = time.time()
-for line in lines:
+for line in fi:
 	parseNow = best_parse(line.strip(), "gloss")
 #	parses = parse(line.strip(), "gloss")
 #	
@@ -2,14 +2,10 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import unicode_literals
-import re, collections, functools, json
-from copy import deepcopy
+import re, collections, functools, json, time, weakref
 from argparse import Namespace
 
-try:
-    from functools import lru_cache
-except ImportError:
-    from functools32 import lru_cache
+_timer = getattr(time, "perf_counter", time.time)
     
 ################################
 #
@@ -17,29 +13,305 @@ except ImportError:
 #
 ################################
         
-def memoized_method(*lru_args, **lru_kwargs):
-    def decorator(func):
+class MemoTables(object):
+    ''' Bookkeeping for the packrat memo tables of parser nodes.  Each node keeps its 
+        own table, mapping (input, input_channel, leftward) to its result (see memoized_method 
+        for cost-bounded searches); this object 
+        counts the entries across all the tables and empties them all when they 
+        exceed the budget, so that a long batch run neither grows without bound nor 
+        has nodes evicting each other's entries.  Call clear() between sentences or 
+        documents to start afresh.  A budget of None means no limit. '''
+    
+    def __init__(self, budget=200000):
+        self.budget = budget
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.clears = 0
+        self.nodes = weakref.WeakSet()
+        
+    def table(self, node):
+        try:
+            return node._memo
+        except AttributeError:
+            node._memo = {}
+            self.nodes.add(node)
+            return node._memo
+            
+    def store(self, node, key, value):
+        if self.budget is not None and self.size >= self.budget:
+            self.clear()
+            self.clears += 1
+        self.table(node)[key] = value
+        self.size += 1
+        
+    def clear(self):
+        ''' Empties every node's memo table '''
+        for node in list(self.nodes):
+            del node._memo
+        self.nodes = weakref.WeakSet()
+        self.size = 0
+        
+    def reset_counters(self):
+        self.hits = self.misses = self.clears = 0
+        
+    def stats(self):
+        return { "hits": self.hits, "misses": self.misses, "clears": self.clears,
+                 "size": self.size, "budget": self.budget, "nodes": len(self.nodes) }
+    
+MEMO = MemoTables()
+
+class CostCeiling(object):
+    ''' The cost ceiling of a cost-bounded search (see Parser.parse_cheapest).  While a
+        limit is set, memoized parsers drop any output whose value in the cost channel 
+        exceeds it, and Sequences don't combine outputs whose costs add up to more.  
+        This only leaves out parses that cost more than the limit if costs are never 
+        negative and never trimmed away (see Trim), so that an output's cost is a lower 
+        bound on the cost of any parse built on it; and a Negation's child is searched 
+        without the limit, since pruning its outputs could turn its failure into success.
+        pruned counts the outputs dropped, so a search can tell whether it was exhaustive. '''
+        
+    def __init__(self):
+        self.channel = None
+        self.limit = None
+        self.pruned = 0
+        
+    def cost(self, output):
+        return output.get(self.channel, 0)
+        
+    def prune(self, results):
+        kept = set(result for result in results if self.cost(result[0]) <= self.limit)
+        self.pruned += len(results) - len(kept)
+        return kept
+        
+CEILING = CostCeiling()
+        
+def memoized_method(func):
+    ''' Decorator for the __call__ methods of parsers; memoizes results in the node's
+        own memo table (see MemoTables).  During a cost-bounded search, results are also
+        pruned to the CostCeiling, and kept under keys that include its limit, along with 
+        the number of outputs pruned while they were worked out. '''
+    @functools.wraps(func)
+    def wrapped_func(self, input, input_channel=None, leftward=False):
+        if CEILING.limit is not None:
+            return bounded_call(func, self, input, input_channel, leftward)
+        key = (input, input_channel, leftward)
+        table = MEMO.table(self)
+        if key in table:
+            MEMO.hits += 1
+            return table[key]
+        MEMO.misses += 1
+        result = func(self, input, input_channel, leftward)
+        MEMO.store(self, key, result)
+        return result
+    return wrapped_func
+    
+def bounded_call(func, self, input, input_channel, leftward):
+    "memoized_method's work during a cost-bounded search."
+    key = (input, input_channel, leftward, CEILING.limit)
+    table = MEMO.table(self)
+    if key in table:
+        MEMO.hits += 1
+        result, pruned = table[key]
+        CEILING.pruned += pruned    # as if it had been computed again
+        return result
+    MEMO.misses += 1
+    pruned = CEILING.pruned
+    result = CEILING.prune(func(self, input, input_channel, leftward))
+    MEMO.store(self, key, (result, CEILING.pruned - pruned))
+    return result
+    
+class NodeStats(object):
+    ''' What the Profiler records for one parser node '''
+    
+    def __init__(self):
+        self.calls = 0
+        self.hits = 0       # of the calls, how many were answered from the node's memo table
+        self.results = 0    # outputs returned, over all calls
+        self.time = 0.0     # seconds, including the node's children
+        
+class Profiler(object):
+    ''' Opt-in instrumentation of parser nodes, to see which part of a grammar the time 
+        goes to.  While enabled, every call of a parser node records its count, whether 
+        its memo table answered it, the number of outputs, and the time taken; the time 
+        spent in each node itself is also added up by call path, where a path lists the 
+        named nodes (see label()) that the call went through, e.g. PARSER;NOUN;N_INT_PLU.  
+        
+            PROFILER.label(vars(tir_morph))   # name nodes after the grammar's variables
+            PROFILER.enable()
+            ... parse ...
+            PROFILER.disable()
+            print(PROFILER.report())
+            
+        Enabling replaces the __call__ method of every Parser class with a wrapper that
+        does the recording, and disabling puts the originals back, so that the profiler
+        costs nothing while it's off.  Only classes defined by the time enable() is called 
+        are instrumented.  A node that calls itself recursively counts its time twice. '''
+    
+    def __init__(self):
+        self.names = {}       # id(node) -> label
+        self.originals = {}   # class -> its own __call__, while enabled
+        self.reset()
+        
+    def reset(self):
+        self.stats = {}       # id(node) -> NodeStats
+        self.self_time = collections.defaultdict(float)   # path -> seconds
+        self.stack = []       # [node, path, time in children] of the calls in progress
+        
+    def label(self, namespace):
+        ''' Names the parser nodes in a namespace (e.g. vars(module)) after their variables.
+            A node bound to several names takes the first in alphabetical order. '''
+        for name, value in sorted(namespace.items(), reverse=True):
+            if isinstance(value, Parser) and not name.startswith("_"):
+                self.names[id(value)] = name
+                
+    def name(self, node):
+        return self.names.get(id(node), type(node).__name__)
+        
+    @property
+    def enabled(self):
+        return bool(self.originals)
+        
+    def enable(self):
+        if self.enabled:
+            return
+        classes = [Parser]
+        while classes:
+            cls = classes.pop()
+            classes += cls.__subclasses__()
+            if "__call__" in cls.__dict__ and cls not in self.originals:
+                self.originals[cls] = cls.__dict__["__call__"]
+                cls.__call__ = self._instrument(cls.__dict__["__call__"])
+                
+    def disable(self):
+        for cls, original in self.originals.items():
+            cls.__call__ = original
+        self.originals = {}
+        
+    def _instrument(self, func):
+        profiler = self
+        
         @functools.wraps(func)
-        def wrapped_func(self, *args, **kwargs):
-            # We're storing the wrapped method inside the instance. If we had
-            # a strong reference to self the instance would never die.
-            self_weak = weakref.ref(self)
-            @functools.wraps(func)
-            @functools.lru_cache(*lru_args, **lru_kwargs)
-            def cached_method(*args, **kwargs):
-                return func(self_weak(), *args, **kwargs)
-            setattr(self, func.__name__, cached_method)
-            return cached_method(*args, **kwargs)
-        return wrapped_func
-    return decorator
+        def profiled(node, input, input_channel=None, leftward=False):
+            stack = profiler.stack
+            if stack and stack[-1][0] is node:   # e.g. RightwardSequence calling Sequence.__call__
+                return func(node, input, input_channel, leftward)
+            path = stack[-1][1] if stack else ()
+            if id(node) in profiler.names or not stack:
+                path += (profiler.name(node),)
+            frame = [node, path, 0.0]
+            hits, misses = MEMO.hits, MEMO.misses
+            stack.append(frame)
+            start = _timer()
+            try:
+                result = func(node, input, input_channel, leftward)
+            finally:
+                elapsed = _timer() - start
+                stack.pop()
+            if stack:
+                stack[-1][2] += elapsed
+            profiler.self_time[path] += elapsed - frame[2]
+            stats = profiler.stats.get(id(node))
+            if stats is None:
+                stats = profiler.stats[id(node)] = NodeStats()
+            stats.calls += 1
+            stats.results += len(result)
+            stats.time += elapsed
+            if MEMO.misses == misses and MEMO.hits == hits + 1:
+                stats.hits += 1
+            return result
+        return profiled
+        
+    def collapsed(self):
+        ''' The time by call path, in the "collapsed stacks" format that flame graph
+            tools (flamegraph.pl, speedscope) read: one "A;B;C microseconds" line per path. '''
+        return "".join("%s %d\n" % (";".join(path), round(seconds * 1e6))
+                       for path, seconds in sorted(self.self_time.items()))
+        
+    def report(self, min_share=0.005):
+        ''' A flame-graph-like tree of the call paths, with the time spent under each 
+            (and its share of the total), and the calls, memo hits and average number 
+            of outputs of the node.  Paths with less than min_share of the time are left out. '''
+        totals = collections.defaultdict(float)
+        children = collections.defaultdict(set)
+        for path, seconds in self.self_time.items():
+            for i in range(1, len(path) + 1):
+                totals[path[:i]] += seconds
+                children[path[:i-1]].add(path[:i])
+        by_name = {}
+        for node_id, stats in self.stats.items():
+            by_name.setdefault(self.names.get(node_id), stats)
+        grand_total = sum(totals[root] for root in children[()]) or 1.0
+        lines = []
+        def walk(path, depth):
+            seconds = totals[path]
+            line = "%-48s %6.1f%% %9.3f s" % ("  " * depth + path[-1], 100 * seconds / grand_total, seconds)
+            stats = by_name.get(path[-1])
+            if stats is not None and stats.calls:
+                line += "  %8d calls %5.1f%% memo hits %6.1f outputs" % (
+                    stats.calls, 100.0 * stats.hits / stats.calls, stats.results * 1.0 / stats.calls)
+            lines.append(line)
+            for child in sorted(children[path], key=lambda p: -totals[p]):
+                if totals[child] >= min_share * grand_total:
+                    walk(child, depth + 1)
+        for root in sorted(children[()], key=lambda p: -totals[p]):
+            walk(root, 0)
+        return "\n".join(lines)
+        
+PROFILER = Profiler()
     
 class HashableDict(dict):
+    ''' An immutable map from channel names to channel values, used for the inputs, 
+        outputs, and remnants of parsers.  Since it never changes once constructed, its 
+        hash is computed once, at construction, and equality tests between maps with 
+        different hashes fail without comparing any items.  An updated copy (made with 
+        with_value() or without(), rather than by item assignment) shares its values 
+        with the original instead of deep-copying them. '''
+    
+    __slots__ = ('_hash',)
+    
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+        self._hash = hash(frozenset(dict.items(self)))
     
     def __hash__(self):
-        return hash(tuple(sorted(self.items())))
+        return self._hash
+        
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if isinstance(other, HashableDict) and self._hash != other._hash:
+            return False
+        return dict.__eq__(self, other)
+        
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+            
+    def __reduce__(self):
+        return (HashableDict, (dict(self),))
+        
+    def _immutable(self, *args, **kwargs):
+        raise TypeError("HashableDict is immutable; use with_value() or without() instead")
+        
+    __setitem__ = __delitem__ = _immutable
+    clear = pop = popitem = setdefault = update = _immutable
+    
+    def with_value(self, key, value):
+        ''' Returns a copy of this map with key set to value '''
+        fields = dict(self)
+        fields[key] = value
+        return HashableDict(fields)
+        
+    def without(self, keys):
+        ''' Returns a copy of this map without any of the given keys '''
+        fields = dict(self)
+        for key in keys:
+            fields.pop(key, None)
+        return HashableDict(fields)
         
     def __lshift__(self, other):
-        result = HashableDict()
+        result = {}
         for key in list(self) + list(other):
             if key in result:
                 continue
@@ -50,10 +322,10 @@ class HashableDict(dict):
             else:
                 result[key] = self[key] >> other[key]
                     
-        return result
+        return HashableDict(result)
         
     def __rshift__(self, other):
-        result = HashableDict()
+        result = {}
         for key in list(self) + list(other):
             if key in result:
                 continue
@@ -63,8 +335,96 @@ class HashableDict(dict):
                 result[key] = self[key]
             else:
                 result[key] = self[key] << other[key]
-        return result    
+        return HashableDict(result)
     
+    
+class AffixTrie(object):
+    ''' A character trie over affix strings.  A Choice uses one of these to find, in a 
+        single walk over the edge of the input, every alternative whose leading literal 
+        could match there, rather than testing each literal in turn. '''
+    
+    def __init__(self, leftward=False):
+        self.leftward = leftward
+        self.root = {}
+        
+    def add(self, affix, value):
+        node = self.root
+        for char in (affix if self.leftward else reversed(affix)):
+            node = node.setdefault(char, {})
+        node.setdefault(None, []).append(value)
+        
+    def search(self, text):
+        ''' Yields the values of every affix that is a prefix (if leftward) or a 
+            suffix (if not) of text. '''
+        node = self.root
+        for char in (text if self.leftward else reversed(text)):
+            node = node.get(char)
+            if node is None:
+                return
+            for value in node.get(None, []):
+                yield value
+    
+class PatternIndex(object):
+    ''' The regex patterns that a Choice's alternatives have to match the whole input 
+        against (see Parser._pattern_gate), merged into a single regex, so that one match 
+        finds which alternatives can succeed, rather than a match per alternative.  Each 
+        alternative is a named group of the merged regex; the groups inside the patterns 
+        don't capture (the alternatives' own parsers do that, on a match), and alternatives 
+        of literal strings, like the consonants "b|d|d͡ʒ|...", are tried longest first. '''
+    
+    def __init__(self):
+        self.values = []
+        self.regexes = []
+        self.parts = []
+        self.merged = None
+        
+    @staticmethod
+    def mergeable(pattern):
+        ''' Whether a pattern's groups can all be made non-capturing: no escapes (which 
+            could be backreferences), no nested or special groups. '''
+        depth = 0
+        for i, char in enumerate(pattern):
+            if char == "\\":
+                return False
+            if char == "(":
+                if depth or pattern[i+1:i+2] == "?":
+                    return False
+                depth += 1
+            elif char == ")":
+                depth -= 1
+        return depth == 0
+        
+    @staticmethod
+    def rewrite(pattern):
+        "The pattern with non-capturing groups, and literal alternatives longest first."
+        def group(match):
+            options = match.group(1).split("|")
+            if not any(c in ".^$*+?{}[]" for option in options for c in option):
+                options = sorted(options, key=len, reverse=True)
+            return "(?:%s)" % "|".join(options)
+        return re.sub(r"\(([^()]*)\)", group, pattern)
+        
+    def add(self, pattern, value):
+        self.parts.append("(?P<alt%d>(?:%s)$)" % (len(self.values), self.rewrite(pattern)))
+        self.regexes.append(re.compile(pattern + r"$"))
+        self.values.append(value)
+        self.merged = None
+        
+    def __len__(self):
+        return len(self.values)
+        
+    def search(self, text):
+        ''' Returns the values of every pattern that matches the whole of text.  The merged 
+            regex finds the first; the ones after it are then tested on their own. '''
+        if self.merged is None:
+            self.merged = re.compile("|".join(self.parts))
+        match = self.merged.match(text)
+        if not match:
+            return []
+        first = int(match.lastgroup[3:])
+        return [self.values[first]] + [ self.values[i] for i in range(first + 1, len(self.values)) 
+                                        if self.regexes[i].match(text) ]
+        
              
         
 ##################################
@@ -77,6 +437,7 @@ class Channel(object):
         
     def __init__(self, name):
         self.name = name
+        self._hash = hash(str(self))   # channels are used in every memo key, so hash once
         
     def __eq__(self, other):
         if other == None:
@@ -84,7 +445,7 @@ class Channel(object):
         return str(self) == str(other)
 
     def __hash__(self):
-        return hash(str(self))
+        return self._hash
         
     def __call__(self, str):
         return Default(str, self)
@@ -123,9 +484,7 @@ class ChannelSequence(Channel):
     def __init__(self, l_child, r_child):
         self.l_child = l_child
         self.r_child = r_child
-        
-    def __hash__(self):
-        return hash(str(self))
+        self._hash = hash(str(self))
         
     def __call__(self, str):
         return self.l_child(str) + self.r_child(str)
@@ -193,6 +552,77 @@ class AbstractPatternTyp(object):
     def __repr__(self):
         return str(self)
         
+REGEX_SPECIALS = set(".^$*+?{}[]\\|()")
+
+def literal_alternatives(pattern, limit=5000):
+    ''' The strings a regex pattern matches, if it only consists of literal characters 
+        and groups of literal alternatives, like "(a|e|i|o|u)(b|ch|d)"; otherwise None. '''
+    results = [""]
+    i = 0
+    while i < len(pattern):
+        if pattern[i] == "(":
+            end = pattern.find(")", i)
+            if end < 0:
+                return None
+            options = pattern[i+1:end].split("|")
+            if any(c in REGEX_SPECIALS for option in options for c in option):
+                return None
+            i = end + 1
+        elif pattern[i] in REGEX_SPECIALS:
+            return None
+        else:
+            options = [pattern[i]]
+            i += 1
+        results = [ result + option for result in results for option in options ]
+        if len(results) > limit:
+            return None
+    return results
+    
+class EdgeTest(object):
+    ''' A predicate on a string, testing whether it ends (or starts) with a match of a 
+        regex pattern, not counting any trailing (leading) delimiters.  Compiled once, 
+        when the grammar is built: a pattern that only matches single characters, like 
+        "(a|e|i|o|u)", becomes a test of the last (first) character against a set, and 
+        one that only matches a few literal strings, like "(aa|ee|ii|oo|uu)", a call of 
+        endswith() (startswith()) with a tuple of them.  Other patterns are compiled 
+        to regexes.  Use edge_test() to share one predicate between equal tests. '''
+    
+    def __init__(self, pattern, at_end=True):
+        self.pattern = pattern
+        self.at_end = at_end
+        literals = literal_alternatives(pattern)
+        self.chars = self.literals = self.regex = None
+        if literals is not None and all(len(literal) == 1 for literal in literals):
+            self.chars = frozenset(literals)
+        elif literals is not None:
+            self.literals = tuple(literals)
+        else:
+            self.regex = re.compile(pattern + "$" if at_end else "^" + pattern)
+            
+    def __call__(self, text):
+        if self.at_end:
+            text = text.rstrip(text.delimiter())
+            if self.chars is not None:
+                return text[-1:] in self.chars
+            if self.literals is not None:
+                return text.endswith(self.literals)
+        else:
+            text = text.lstrip(text.delimiter())
+            if self.chars is not None:
+                return text[:1] in self.chars
+            if self.literals is not None:
+                return text.startswith(self.literals)
+        return self.regex.search(text) is not None
+        
+EDGE_TESTS = {}
+
+def edge_test(pattern, at_end=True):
+    ''' The EdgeTest for the pattern and edge, made the first time it's asked for. '''
+    key = (pattern, at_end)
+    if key not in EDGE_TESTS:
+        EDGE_TESTS[key] = EdgeTest(pattern, at_end)
+    return EDGE_TESTS[key]
+        
 class AbstractStr(unicode):
     ''' This is a subclass of str that string channels' typs descend from; it defines
         some default behavior for concatenation, testing for prefixation/suffixation, etc. '''
@@ -200,24 +630,29 @@ class AbstractStr(unicode):
     def __lshift__(self, other):
         if other.is_pattern():
             return AbstractPatternTyp("%s%s%s" % (self, self.delimiter(), other), other.typ)
-        return type(self)("%s%s%s" % (self, self.delimiter(), other))
+        return self.concatenate(other)
         
     def __rshift__(self, other):
         if other.is_pattern():
             return other.replacePattern(self)
-        return type(self)("%s%s%s" % (self, self.delimiter(), other))
+        return self.concatenate(other)
+        
+    def concatenate(self, other):
+        ''' self and other, with the delimiter between them.  Without a delimiter, an empty
+            side (as from NULL) just gives the other side. '''
+        delim = self.delimiter()
+        if not delim:
+            if not other:
+                return self
+            if not self and type(other) is type(self):
+                return other
+        return type(self)("%s%s%s" % (self, delim, other))
         
     def endsWith(self, other):
-        comparison_form = self.rstrip(self.delimiter())
-	r1 = re.compile(other + "$")	
-	return r1.search(comparison_form)
-        #return comparison_form.endswith(other)
+        return edge_test(other, True)(self)
     
     def startsWith(self, other):
-        comparison_form = self.lstrip(self.delimiter())
-        r1 = re.compile("^" + other)
-	return r1.search(comparison_form)
-	#return comparison_form.startswith(other)
+        return edge_test(other, False)(self)
     
     def hasPrefix(self, other):
         if self == other:
@@ -235,17 +670,143 @@ class AbstractStr(unicode):
         assert(self.hasPrefix(other))
         if self == other:
             return type(self)('')
-        return Concatenated.typ(self[len(other)+len(self.delimiter()):])
+        return self._strip_prefix(other)
     
     def stripSuffix(self, other):
         assert(self.hasSuffix(other))
         if self == other:
             return type(self)('')
+        return self._strip_suffix(other)
+        
+    def _strip_prefix(self, other):
+        return Concatenated.typ(self[len(other)+len(self.delimiter()):])
+        
+    def _strip_suffix(self, other):
         return type(self)(self[:-len(other)-len(self.delimiter())])
 
     def is_pattern(self):
         #return self[:1] == '/' and self[-1:] == '/'
         return False
+
+    def split_points(self, leftward=False):
+        ''' The offsets at which Guess can split this string into a stem at the start (if 
+            leftward) or the end (if not) and an affix: every offset, if there's no delimiter,
+            or else only those next to one, since the stem has to be delimited from the rest. '''
+        delim = self.delimiter()
+        if not delim:
+            return range(1, len(self) + 1) if leftward else range(len(self))
+        if not self:
+            return []
+        if leftward:
+            return [ i for i in range(1, len(self)) if self.startswith(delim, i) ] + [len(self)]
+        return [0] + [ i + len(delim) for i in range(len(self) - len(delim)) if self.startswith(delim, i) ]
+
+
+class SegmentTable(object):
+    ''' Interns the segments (phonemes) of IPA transcriptions as small integers, and splits
+        transcriptions into tuples of them.  A segment is a character together with any
+        modifier letters and combining marks after it (ʼ, ʷ, ʰ, ː, ...) and, after a tie
+        bar, the character it ties it to; so t͡ʃʼ is one segment, not four.  Each split is
+        remembered, up to MEMO_SIZE transcriptions. '''
+
+    SEGMENT = re.compile("(?s).(?:[\u035c\u0361].|[\u02b0-\u02ff\u0300-\u036f])*")
+    MEMO_SIZE = 100000
+
+    def __init__(self):
+        self.ids = {}
+        self.segments = []
+        self.memo = {}
+
+    def intern(self, segment):
+        id = self.ids.get(segment)
+        if id is None:
+            id = self.ids[segment] = len(self.segments)
+            self.segments.append(segment)
+        return id
+
+    def split(self, text):
+        ''' Returns a pair (ids, offsets): the IDs of the text's segments, and the offsets
+            at which they start, followed by the length of the text. '''
+        result = self.memo.get(text)
+        if result is None:
+            segments = self.SEGMENT.findall(text)
+            ids, offsets, offset = [], [], 0
+            for segment in segments:
+                ids.append(self.intern(segment))
+                offsets.append(offset)
+                offset += len(segment)
+            offsets.append(offset)
+            result = (tuple(ids), tuple(offsets))
+            self.remember(text, result)
+        return result
+
+    def remember(self, text, result):
+        if len(self.memo) >= self.MEMO_SIZE:
+            self.memo.clear()
+        self.memo[text] = result
+
+SEGMENTS = SegmentTable()
+
+class SegmentedStr(AbstractStr):
+    ''' A typ for channels of concatenated IPA transcriptions (see Segmented), whose values
+        are compared and cut a segment at a time rather than a character at a time, as
+        tuples of interned segment IDs.  An affix matches only if it ends (or starts) at
+        a boundary between segments, so ʃʼ is not a suffix of t͡ʃʼ, and Guess only tries
+        stems that start (or end) at one. '''
+
+    def endsWith(self, other):
+        ids, other_ids = SEGMENTS.split(self)[0], SEGMENTS.split(other)[0]
+        return not other_ids or ids[-len(other_ids):] == other_ids
+
+    def startsWith(self, other):
+        ids, other_ids = SEGMENTS.split(self)[0], SEGMENTS.split(other)[0]
+        return ids[:len(other_ids)] == other_ids
+
+    def hasPrefix(self, other):
+        if self == other:
+            return True
+        ids, other_ids = SEGMENTS.split(self)[0], SEGMENTS.split(other)[0]
+        return bool(other_ids) and ids[:len(other_ids)] == other_ids
+
+    def hasSuffix(self, other):
+        if self == other:
+            return True
+        ids, other_ids = SEGMENTS.split(self)[0], SEGMENTS.split(other)[0]
+        return bool(other_ids) and ids[-len(other_ids):] == other_ids
+
+    def _strip_prefix(self, other):
+        return type(self)(self[len(other):])
+
+    def _strip_suffix(self, other):
+        ids, offsets = SEGMENTS.split(self)
+        n = len(ids) - len(SEGMENTS.split(other)[0])
+        result = type(self)(self[:offsets[n]])
+        SEGMENTS.remember(result, (ids[:n], offsets[:n+1]))   # the stem's split comes for free
+        return result
+
+    def split_points(self, leftward=False):
+        offsets = SEGMENTS.split(self)[1]
+        return offsets[1:] if leftward else offsets[:-1]
+
+
+class AbstractNum(int):
+    ''' This is a subclass of int that numeric channels' typs (e.g. costs) descend from;
+        sequencing two values adds them.  A string is taken to stand for its length, 
+        so that a cost can still be given as "XXXX". '''
+        
+    def __new__(cls, value=0):
+        if isinstance(value, basestring):
+            value = len(value)
+        return int.__new__(cls, value)
+        
+    def __lshift__(self, other):
+        return type(self)(int(self) + int(other))
+        
+    def __rshift__(self, other):
+        return type(self)(int(self) + int(other))
+        
+    def is_pattern(self):
+        return False
         
         
 #######################################
@@ -263,8 +824,31 @@ class Parser(object):
         return self.channel
         
     def _is_trivial(self, input_channel):
-        #print(self.get_channel(), input_channel)
-        return not(set(self.get_channel()) & set(input_channel))
+        ''' Whether this parser has no channel in common with the input channel, so that
+            it can't consume anything.  Worked out once per input channel, since a node's
+            channels don't change. '''
+        try:
+            return self._trivial[input_channel]
+        except AttributeError:
+            self._trivial = {}
+        except KeyError:
+            pass
+        trivial = self._trivial[input_channel] = not(set(self.get_channel()) & set(input_channel))
+        return trivial
+        
+    def _gates(self, input_channel, leftward=False):
+        ''' Used by Choice to index its alternatives.  Returns a pair (gates, transparent), 
+            where gates is a list of (LiteralParser, leftward) pairs, one of which has to 
+            match the edge of the input before this parser can succeed (or None if there's 
+            no such list), and transparent is whether this parser always leaves the input
+            channel of the remnant untouched. '''
+        return None, False
+        
+    def _pattern_gate(self, input_channel, leftward=False):
+        ''' Used by Choice to index its alternatives.  Returns the PatternParser whose 
+            pattern has to match the whole of the input before this parser can succeed, 
+            if there is one, or None. '''
+        return None
     
     def __lshift__(self, other):
         assert(isinstance(other, Parser))
@@ -300,7 +884,7 @@ class Parser(object):
     def _nontrivial_parse(self, input, input_channel, leftward=False):
         return self.constructEmptyOutput(input)  # a trivial success
         
-    @lru_cache(maxsize=1000)
+    @memoized_method
     def __call__(self, input, input_channel=None, leftward=False):
     
         if input_channel == None:  # assign it here rather than in the function definition
@@ -326,11 +910,34 @@ class Parser(object):
             print("ERROR: Cannot parse a non-string data type: %s" % input_channel)
             return []
             
-        input = HashableDict()
+        input = {}
         for input_channel in input_channel:
             input[input_channel.name] = input_channel.typ(s)
+        input = HashableDict(input)
         parses = self(input, input_channel)
         return [output for output, remnant in parses if not remnant[input_channel.name]]
+        
+    def parse_cheapest(self, s, top, cost_channel, input_channel=None, slack=0, ceiling=16):
+        ''' Like parse(), but only sure to return the top cheapest parses by the numeric
+            cost_channel (and any that tie with the last of them), which can be much 
+            faster than finding them all.  Parses under a cost ceiling, pruning partial 
+            outputs that already cost more, and doubles the ceiling until at least top 
+            parses cost no more than the ceiling minus slack, or nothing was pruned.  
+            (Use slack if the caller lowers some costs by up to that much afterwards.)  
+            The parses returned are all those that cost no more than the final ceiling, 
+            provided the grammar meets the conditions given in CostCeiling. '''
+            
+        while True:
+            CEILING.channel, CEILING.limit, CEILING.pruned = cost_channel.name, ceiling, 0
+            try:
+                parses = self.parse(s, input_channel)
+            finally:
+                CEILING.limit = None
+            if CEILING.pruned == 0:
+                return parses
+            if sum(1 for p in parses if CEILING.cost(p) <= ceiling - slack) >= top:
+                return parses
+            ceiling *= 2
  
             
 class LiteralParser(Parser):
@@ -345,6 +952,11 @@ class LiteralParser(Parser):
     def rechannel(self, channel):
         return Lit(self.text, channel)
         
+    def _gates(self, input_channel, leftward=False):
+        if self._is_trivial(input_channel):
+            return None, True
+        return [(self, leftward)], False
+        
     def _trivial_parse(self, input, input_channel=None, leftward=False):
         return self.constructOutput(self.output, input)
         
@@ -355,8 +967,7 @@ class LiteralParser(Parser):
         stripAffix = text.stripPrefix if leftward else text.stripSuffix
         
         if hasAffix(self.pattern):
-            remnant = deepcopy(input)
-            remnant[self.channel.name] = stripAffix(self.pattern)
+            remnant = input.with_value(self.channel.name, stripAffix(self.pattern))
             return self.constructEmptyOutput(remnant)
         else:
             return set()
@@ -367,6 +978,9 @@ class Guess(Parser):
     def __init__(self, channel=None, output_channels=None):
         super(Guess, self).__init__(channel)
         self.output_channels = output_channels if output_channels else channel
+        
+    def _gates(self, input_channel, leftward=False):
+        return None, self._is_trivial(input_channel)
     
     def _nontrivial_parse(self, input, input_channel=None, leftward=False):
         
@@ -378,17 +992,16 @@ class Guess(Parser):
         hasAffix = text.hasPrefix if leftward else text.hasSuffix
         stripAffix = text.stripPrefix if leftward else text.stripSuffix
                 
-        for i in range(len(text)):
-            remnant = deepcopy(input)
-            substr = text[:i+1] if leftward else text[i:]
+        for i in text.split_points(leftward):
+            substr = text[:i] if leftward else text[i:]
             stem = input_channel.typ(substr)
             if hasAffix(stem):
-                remnant[input_channel.name] = stripAffix(stem)
-                output = HashableDict()
+                remnant = input.with_value(input_channel.name, stripAffix(stem))
+                output = {}
                 for output_channel in self.output_channels:
                     if output_channel != input_channel:
                         output[output_channel.name] = output_channel.typ(stem)
-                results.add((output, remnant))
+                results.add((HashableDict(output), remnant))
         return results
 
 class BinaryCombinator(Parser):
@@ -405,15 +1018,50 @@ class BinaryCombinator(Parser):
 class Sequence(BinaryCombinator):
     ''' A parser that executes its children in sequence, and applying the second to the remnant of the first.  The direction (left child first or right child first) depends on the value passed into the parameter leftward. '''
 
-    @lru_cache(maxsize=1000)
+    def _gates(self, input_channel, leftward=False):
+        child1 = self.l_child if leftward else self.r_child
+        child2 = self.r_child if leftward else self.l_child
+        gates, transparent = child1._gates(input_channel, leftward)
+        if gates is not None or not transparent:
+            return gates, False
+        return child2._gates(input_channel, leftward)
+        
+    def _pattern_gate(self, input_channel, leftward=False):
+        child1 = self.l_child if leftward else self.r_child
+        child2 = self.r_child if leftward else self.l_child
+        gate = child1._pattern_gate(input_channel, leftward)
+        if gate is not None:
+            return gate
+        gates, transparent = child1._gates(input_channel, leftward)
+        if gates is None and transparent:    # child2 sees the same input
+            return child2._pattern_gate(input_channel, leftward)
+        return None
+
+    @memoized_method
     def __call__(self, input, input_channel=None, leftward=False):
             
         child1 = self.l_child if leftward else self.r_child
         child2 = self.r_child if leftward else self.l_child
         
+        if CEILING.limit is not None:
+            return self._bounded_call(child1, child2, input, input_channel, leftward)
+        results = set()
+        for outputs1, remnant1 in child1(input, input_channel, leftward):
+            for outputs2, remnant2 in child2(remnant1, input_channel, leftward):
+                outputs = outputs1 >> outputs2 if leftward else outputs2 << outputs1
+                results.add((outputs, remnant2))
+        return results
+        
+    def _bounded_call(self, child1, child2, input, input_channel, leftward):
+        ''' The sequence during a cost-bounded search: outputs whose costs add up to 
+            more than the CostCeiling aren't combined. '''
+        limit = CEILING.limit
         results = set()
         for outputs1, remnant1 in child1(input, input_channel, leftward):
             for outputs2, remnant2 in child2(remnant1, input_channel, leftward):
+                if CEILING.cost(outputs1) + CEILING.cost(outputs2) > limit:
+                    CEILING.pruned += 1
+                    continue
                 outputs = outputs1 >> outputs2 if leftward else outputs2 << outputs1
                 results.add((outputs, remnant2))
         return results
@@ -423,7 +1071,12 @@ class RightwardSequence(Sequence):
         of the directionality of higher combinators. (That is to say, it ignores the
         passed-in value of the leftward parameter and always acts as if it's False.) '''
         
-    @lru_cache(maxsize=1000)
+    def _gates(self, input_channel, leftward=False):
+        return super(RightwardSequence, self)._gates(input_channel, False)
+        
+    def _pattern_gate(self, input_channel, leftward=False):
+        return super(RightwardSequence, self)._pattern_gate(input_channel, False)
+        
     def __call__(self, input, input_channel=None, leftward=False):
         return super(RightwardSequence, self).__call__(input, input_channel, False)  
   
@@ -432,15 +1085,99 @@ class LeftwardSequence(Sequence):
         of the directionality of higher combinators. (That is to say, it ignores the
         passed-in value of the leftward parameter and always acts as if it's True.)'''
     
-    @lru_cache(maxsize=1000)
+    def _gates(self, input_channel, leftward=False):
+        return super(LeftwardSequence, self)._gates(input_channel, True)
+        
+    def _pattern_gate(self, input_channel, leftward=False):
+        return super(LeftwardSequence, self)._pattern_gate(input_channel, True)
+        
     def __call__(self, input, input_channel=None, leftward=False):
         return super(LeftwardSequence, self).__call__(input, input_channel, True)
         
 class Choice(BinaryCombinator):
+    ''' A parser that tries each of its alternatives on the input and returns the union 
+        of their results.  A chain of Choices (A | B | C ...) is flattened, and the 
+        alternatives that have to start by matching a literal affix are indexed in an 
+        AffixTrie, so that only those whose affix is actually at the edge of the input 
+        get called.  Likewise, those that have to start by matching a regex pattern
+        against the whole input are merged into a PatternIndex. '''
+
+    def __init__(self, l_child, r_child):
+        super(Choice, self).__init__(l_child, r_child)
+        self.compiled = {}
+        
+    def alternatives(self):
+        for child in (self.l_child, self.r_child):
+            if type(child) is Choice:
+                for alternative in child.alternatives():
+                    yield alternative
+            else:
+                yield child
+                
+    def _gates(self, input_channel, leftward=False):
+        gates = []
+        transparent = True
+        for alternative in self.alternatives():
+            alt_gates, alt_transparent = alternative._gates(input_channel, leftward)
+            transparent = transparent and alt_transparent
+            if alt_gates is None:
+                gates = None
+            elif gates is not None:
+                gates += alt_gates
+        if gates is None:
+            return None, transparent
+        return gates, False
+        
+    def compile(self, input_channel, leftward=False):
+        ''' Builds (or fetches) the index of alternatives for this input channel and 
+            direction: a list of alternatives that always have to be tried, an
+            AffixTrie of those keyed by the affix they start by matching, and a 
+            PatternIndex of those keyed by the pattern they start by matching (or None, 
+            if fewer than two do). '''
+        key = (input_channel, leftward)
+        if key not in self.compiled:
+            ungated = []
+            trie = AffixTrie(leftward)
+            patterns = PatternIndex()
+            for alternative in self.alternatives():
+                gates, transparent = alternative._gates(input_channel, leftward)
+                if not gates or any(lit.channel.name != input_channel.name or 
+                                    lit_leftward != leftward or not lit.pattern
+                                    for lit, lit_leftward in gates):
+                    gate = alternative._pattern_gate(input_channel, leftward)
+                    if gate is not None and PatternIndex.mergeable(gate.pattern):
+                        patterns.add(gate.pattern, alternative)
+                    else:
+                        ungated.append(alternative)
+                    continue
+                for lit, lit_leftward in gates:
+                    trie.add(lit.pattern, alternative)
+            if len(patterns) < 2:
+                ungated += patterns.values
+                patterns = None
+            self.compiled[key] = (ungated, trie, patterns)
+        return self.compiled[key]
 
-    @lru_cache(maxsize=1000)
+    @memoized_method
     def __call__(self, input, input_channel=None, leftward=False):
-        return self.l_child(input, input_channel, leftward) | self.r_child(input, input_channel, leftward)
+    
+        if input_channel == None:  # assign it here rather than in the function definition
+            input_channel = DEFAULTS.Text   # in case the library user redefines the concatenation type of Text
+            
+        ungated, trie, patterns = self.compile(input_channel, leftward)
+        results = set()
+        for alternative in ungated:
+            results |= alternative(input, input_channel, leftward)
+        if patterns is not None:
+            for alternative in patterns.search(input[input_channel.name]):
+                results |= alternative(input, input_channel, leftward)
+        tried = set()
+        for alternative in trie.search(input[input_channel.name]):
+            if id(alternative) in tried:
+                continue
+            tried.add(id(alternative))
+            results |= alternative(input, input_channel, leftward)
+        return results
 
         
 class AssertParser(Parser):
@@ -458,7 +1195,10 @@ class AssertParser(Parser):
     def _is_trivial(self, input_channel):
         return True
         
-    @lru_cache(maxsize=1000)
+    def _gates(self, input_channel, leftward=False):
+        return None, True
+        
+    @memoized_method
     def __call__(self, input, input_channel=None, leftward=False):
             
         if self.channel.name not in input or not self.channel <= input_channel:
@@ -480,7 +1220,7 @@ class Delay(Parser):
     def get_channel(self):
         return self.parser().get_channel()
         
-    @lru_cache(maxsize=1000)
+    @memoized_method
     def __call__(self, input, input_channel=None, leftward=False):
         return self.parser()(input, input_channel)    
         
@@ -496,9 +1236,16 @@ class Negation(Parser):
     def get_channel(self):
         return self.child.get_channel()
         
-    @lru_cache(maxsize=1000)
+    def _gates(self, input_channel, leftward=False):
+        return None, True
+        
+    @memoized_method
     def __call__(self, input, input_channel=None, leftward=False):
-        child_results = self.child(input, input_channel, leftward)
+        limit, CEILING.limit = CEILING.limit, None    # see CostCeiling
+        try:
+            child_results = self.child(input, input_channel, leftward)
+        finally:
+            CEILING.limit = limit
         if child_results:
             return set()
         return self.constructEmptyOutput(input)
@@ -508,6 +1255,9 @@ class NullParser(Parser):
 
     def __init__(self):
         super(NullParser, self).__init__([])
+        
+    def _gates(self, input_channel, leftward=False):
+        return None, True
        
 def generateGroup(x=0):
     while True:
@@ -592,7 +1342,7 @@ class RedupParser(Parser):
         self.leftward_regexes = {}
         self.rightward_regexes = {}
         
-        self.output = HashableDict()
+        output = {}
         for chn in self.channel:
             
             leftward_pattern = "(" + pattern + ")" + chn.typ().delimiter() + "(" + createNumberedPattern(base_pattern, 2) + ".*)"
@@ -603,10 +1353,14 @@ class RedupParser(Parser):
             
             output_pattern = pattern + chn.typ().delimiter() + base_pattern
         
-            self.output[chn.name] = chn.pattern_typ(output_pattern)
+            output[chn.name] = chn.pattern_typ(output_pattern)
+        self.output = HashableDict(output)
         
     def rechannel(self, channel):
         return Pattern(self.pattern, channel)
+        
+    def _gates(self, input_channel, leftward=False):
+        return None, self._is_trivial(input_channel)
     
     def _trivial_parse(self, input, input_channel=None, leftward=False):
         return self.constructOutput(self.output, input)
@@ -619,13 +1373,12 @@ class RedupParser(Parser):
             match = self.rightward_regexes[input_channel].match(text_in)
         if not match:
             return set()
-        remnant = deepcopy(input)
         if leftward:
-            remnant[input_channel.name] = input_channel.typ(match.groups()[-1])
+            remnant = input.with_value(input_channel.name, input_channel.typ(match.groups()[-1]))
         else:
-            remnant[input_channel.name] = input_channel.typ(match.group(1))
+            remnant = input.with_value(input_channel.name, input_channel.typ(match.group(1)))
             
-        result = HashableDict()
+        result = {}
         for chn in self.channel:
             if chn == input_channel:
                 continue
@@ -634,7 +1387,7 @@ class RedupParser(Parser):
             else:
                 result[chn] = chn.typ(match.groups()[-1])
         
-        return self.constructOutput(result, remnant)
+        return self.constructOutput(HashableDict(result), remnant)
     
 class PatternParser(Parser):
 
@@ -653,6 +1406,14 @@ class PatternParser(Parser):
                 self.channel.pattern_typ(pattern)
         })
         
+    def _gates(self, input_channel, leftward=False):
+        return None, self._is_trivial(input_channel)
+        
+    def _pattern_gate(self, input_channel, leftward=False):
+        if len(input_channel) == 1 and not self._is_trivial(input_channel):
+            return self
+        return None
+        
     def _trivial_parse(self, input, input_channel=None, leftward=False):
         return self.constructOutput(self.output, input)
         
@@ -661,8 +1422,7 @@ class PatternParser(Parser):
         match = self.parse_regex.match(text_in)
         if not match:
             return set()
-        remnant = deepcopy(input)
-        remnant[input_channel.name] = self.channel.join(match.groups())
+        remnant = input.with_value(input_channel.name, self.channel.join(match.groups()))
         return self.constructEmptyOutput(remnant)
         
     def rechannel(self, channel):
@@ -675,7 +1435,13 @@ class Trim(Parser):
         self.child = child
         self.channel = channel
         
-    @lru_cache(maxsize=1000)
+    def _gates(self, input_channel, leftward=False):
+        return self.child._gates(input_channel, leftward)
+        
+    def _pattern_gate(self, input_channel, leftward=False):
+        return self.child._pattern_gate(input_channel, leftward)
+        
+    @memoized_method
     def __call__(self, input, input_channel=None, leftward=False):
     
         if input_channel == None:  # assign it here rather than in the function definition
@@ -683,10 +1449,7 @@ class Trim(Parser):
             
         results = set()
         for child_output, child_remnant in self.child(input, input_channel, leftward):
-            output = deepcopy(child_output)
-            for channel in self.channel:
-                if channel.name in output:
-                    del output[channel.name]
+            output = child_output.without([channel.name for channel in self.channel])
             results.add((output, child_remnant))
         return results  
 
@@ -696,6 +1459,9 @@ class Truncate(Parser):
         self.text = text
         self.channel = channel
         
+    def _gates(self, input_channel, leftward=False):
+        return None, self._is_trivial(input_channel)
+        
     def __call__(self, input, input_channel=None, leftward=False):
     
         if input_channel == None:  # assign it here rather than in the function definition
@@ -704,13 +1470,141 @@ class Truncate(Parser):
         if self._is_trivial(input_channel):
             return self.constructEmptyOutput(input)
             
-        remnant = deepcopy(input)
         if leftward:
-            remnant[input_channel.name] = input_channel.typ(self.text) >> remnant[input_channel.name]
+            remnant = input.with_value(input_channel.name, input_channel.typ(self.text) >> input[input_channel.name])
         else:
-            remnant[input_channel.name] = remnant[input_channel.name] << input_channel.typ(self.text)
+            remnant = input.with_value(input_channel.name, input[input_channel.name] << input_channel.typ(self.text))
         return self.constructEmptyOutput(remnant)
-        
+
+
+class GrammarOptimizer(object):
+    ''' A pass over a constructed grammar, run once before it's used, that removes
+        redundant nodes without changing what it parses:
+
+            - identical subtrees are merged into one node (hash-consing), so that they
+              share a memo table.  Two nodes are identical if they're of the same class
+              and have the same text, pattern, predicate and channels (with the same
+              typs), and the same children;
+            - an alternative that occurs more than once in a chain of Choices is
+              dropped, since a Choice returns the union of its alternatives' results;
+            - a Sequence with NULL on one side becomes the other side, since NULL's only
+              result is an empty output and the input untouched.  (A RightwardSequence
+              or LeftwardSequence is only folded into a child that sets the same
+              direction, or into NULL.)
+
+        The nodes are changed in place, so the grammar's named layers stay as they were,
+        only with their redundant parts taken out; optimize() returns the new root,
+        which is a different node if the old one was folded or merged away.  Nodes of
+        other classes (Lookup, Delay, etc.) are left alone, and not looked inside.
+
+            PARSER = OPTIMIZER.optimize(PARSER)
+            print(OPTIMIZER.report())   # node counts before and after '''
+
+    CHILDREN = ("l_child", "r_child", "child")
+
+    def __init__(self):
+        self.canonical = {}   # key of a node -> the node that stands for all such nodes
+        self.done = {}        # id(node) -> (node, what it became)
+        self.before = 0
+        self.after = 0
+        self.merged = 0
+        self.dropped = 0
+        self.folded = 0
+
+    def optimize(self, parser):
+        self.before += self.count(parser)
+        result = self.visit(parser)
+        self.after += self.count(result)
+        MEMO.clear()    # in case it was used already; see also visit()
+        return result
+
+    def children(self, node):
+        return [ attr for attr in self.CHILDREN if isinstance(getattr(node, attr, None), Parser) ]
+
+    def count(self, parser):
+        "The number of distinct nodes in the grammar."
+        seen, stack = set(), [parser]
+        while stack:
+            node = stack.pop()
+            if id(node) not in seen:
+                seen.add(id(node))
+                stack += [ getattr(node, attr) for attr in self.children(node) ]
+        return len(seen)
+
+    def visit(self, node):
+        if id(node) in self.done:
+            return self.done[id(node)][1]
+        original = node
+        for attr in self.children(node):
+            setattr(node, attr, self.visit(getattr(node, attr)))
+        if isinstance(node, Choice):
+            node.compiled = {}    # its gates, made from the alternatives it had before
+        node = self.simplify(node)
+        key = self.key(node)
+        if key is not None:
+            canonical = self.canonical.setdefault(key, node)
+            if canonical is not node:
+                self.merged += 1
+                node = canonical
+        self.done[id(original)] = (original, node)
+        return node
+
+    def simplify(self, node):
+        cls = type(node)
+        if cls is Choice:
+            alternatives = []
+            for alternative in node.alternatives():
+                if not any(alternative is a for a in alternatives):
+                    alternatives.append(alternative)
+            dropped = sum(1 for a in node.alternatives()) - len(alternatives)
+            if not dropped:
+                return node
+            self.dropped += dropped
+            if len(alternatives) == 1:
+                return alternatives[0]
+            node.l_child = functools.reduce(Choice, alternatives[:-1])
+            node.r_child = alternatives[-1]
+            return node
+        if cls in (Sequence, RightwardSequence, LeftwardSequence):
+            for child, other in ((node.l_child, node.r_child), (node.r_child, node.l_child)):
+                if isinstance(child, NullParser) and (cls is Sequence or type(other) in (cls, NullParser)):
+                    self.folded += 1
+                    return other
+        return node
+
+    @staticmethod
+    def channel_key(channel):
+        return tuple((type(c), c.name) for c in channel)
+
+    def key(self, node):
+        ''' What identifies a node of a class whose behaviour is fixed by its fields, given
+            that its children have already been merged; or None, for other classes. '''
+        cls = type(node)
+        if cls in (Sequence, RightwardSequence, LeftwardSequence):
+            return (cls, id(node.l_child), id(node.r_child))
+        if cls is Choice:
+            return (cls, frozenset(id(a) for a in node.alternatives()))
+        if cls in (Trim, Negation):
+            return (cls, id(node.child), self.channel_key(node.channel) if cls is Trim else None)
+        if cls is LiteralParser:
+            return (cls, type(node.text), node.text, self.channel_key(node.channel))
+        if cls is PatternParser:
+            return (cls, node.pattern, self.channel_key(node.channel))
+        if cls is Truncate:
+            return (cls, node.text, self.channel_key(node.channel))
+        if cls is AssertParser:
+            return (cls, node.pred, self.channel_key(node.channel))
+        if cls is NullParser:
+            return (cls,)
+        return None
+
+    def report(self):
+        return ("grammar: %d nodes before optimizing, %d after (%d merged, %d duplicate "
+                "alternatives dropped, %d NULL sequences folded)" %
+                (self.before, self.after, self.merged, self.dropped, self.folded))
+
+OPTIMIZER = GrammarOptimizer()
+
 #####################################
 #
 # Convenience functions for channels
@@ -718,10 +1612,21 @@ class Truncate(Parser):
 #####################################
 
 
-def make_channel_from_delimiter(delim):
+class Numeric(Channel):
+    ''' A channel whose values are numbers that add up across a parse, like a cost.  
+        Calling it gives a parser that outputs that number, e.g. Cost(4) or Cost("XXXX"). '''
+
+    class typ(AbstractNum):
+        pass
+        
+    def __call__(self, value):
+        return LiteralParser(value, self)
+        
+
+def make_channel_from_delimiter(delim, base=AbstractStr):
 
     class AnonymousChannel(Channel):
-        class typ(AbstractStr):
+        class typ(base):
             def delimiter(self):
                 return delim
                 
@@ -781,12 +1686,10 @@ def Assert(pred, channel=None):
     return make_multichannel_parser(AssertParser, pred, channel)
         
 def After(s, channel=None):
-    pred = lambda x: x.endsWith(s)
-    return Assert(pred, channel)
+    return Assert(edge_test(s, True), channel)
     
 def Before(s, channel=None):
-    pred = lambda x: x.startsWith(s)
-    return Assert(pred, channel)
+    return Assert(edge_test(s, False), channel)
 
     
 NULL = NullParser()
@@ -801,6 +1704,7 @@ NULL = NullParser()
 Concatenated = make_channel_from_delimiter("")
 Spaced = make_channel_from_delimiter(" ")
 Hyphenated = make_channel_from_delimiter("-")
+Segmented = make_channel_from_delimiter("", SegmentedStr)   # for IPA; see SegmentedStr
         
 Tex = Concatenated("text")
 Mor = Hyphenated("breakdown")
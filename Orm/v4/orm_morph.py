@@ -4,9 +4,9 @@ from __future__ import print_function
 from __future__ import unicode_literals
 from io import open
 import epitran
-import sys, json, glob, os, math
-from copy import deepcopy
+import sys, json, glob, os, math, hashlib, atexit
 from morpar_orm import *
+from parse_cache import ParseCache, files_digest
 import nltk
 from nltk.probability import *
 import cPickle as pickle
@@ -36,10 +36,6 @@ channels = ["breakdown", "lemma", "gloss", "citation", "natural"]
 for index, channel in enumerate(channels):
 	channelIndexDict[channel] = index
 
-
-#with open("orm_common_dict.pkl", "rb") as handle:
-#	commonParseDict = pickle.load(handle)
-
 # NORMALIZATION
 
 
@@ -88,6 +84,19 @@ def get_freq_dist():
     freq.update(brown.words())
     freq.update(setSWords)
     return freq
+
+def definition_cost(definition, freq, total):
+    """Cost of an English definition: the sum over its words of the floored negative 
+    log frequency, and 15 for each word that isn't in the frequency distribution."""
+    cost = 0
+    for word in definition.split():
+        word = word.lower()
+        if word not in freq:
+            cost += 15
+        else:
+            log_freq = -math.log(freq[word] * 1.0 / total)
+            cost += math.floor(log_freq)
+    return int(cost)
 epi = epitran.Epitran("orm-Latn")
 g2p = epi.transliterate
 
@@ -152,20 +161,32 @@ for line in knightFile:
 
 class Lookup(Parser):
     def __init__(self, dictionaryList, channel=None, output_channel=None):
-        self.dictionary = get_dictionary(dictionaryList)
+        self.dictionaryList = dictionaryList
         self.channel = channel
         self.output_channel = output_channel
-        self.freqDist = get_freq_dist()
-        self.engWords = self.freqDist.N()
+        # work out each definition's cost once, rather than on every lookup
+        freqDist = get_freq_dist()
+        engWords = freqDist.N()
+        costs = {}
+        def cost(definition):
+            if definition not in costs:
+                costs[definition] = definition_cost(definition, freqDist, engWords)
+            return costs[definition]
+        self.dictionary = {}
+        for norm, pairs in get_dictionary(dictionaryList).items():
+            self.dictionary[norm] = [ (lemma, definition, cost(definition)) for lemma, definition in pairs ]
+        self.gazetteer = {}
+        for ormWord, englishes in gazDict.items():
+            self.gazetteer[ormWord] = [ (english, cost(english)) for english in englishes ]
     
-    @lru_cache(maxsize=1000)
+    @memoized_method
     def __call__(self, input, input_channel=None, leftward=False):
         results = set()
         
         text = input[input_channel.name]
         text = text.strip()
         
-        output = HashableDict()
+        output = {}
         remnant = HashableDict({input_channel.name:input_channel.typ()})
         
         for channel in self.channel:
@@ -192,39 +213,20 @@ class Lookup(Parser):
 #		output2[Cost.name] = Cost.typ("X" * int(cost))
 #                results.add((output2,remnant))
         if low in self.dictionary:
-            for pair in self.dictionary[low]:
-                definition = pair[1]
-		lemma = pair[0]
-		cost = 0
-                for word in definition.split():
-                    word = word.lower()
-                    if word not in self.freqDist:
-                        cost += 15
-                    else:
-                        log_freq = -math.log(self.freqDist[word] * 1.0 / self.engWords)
-                        cost += math.floor(log_freq)
-                output2 = deepcopy(output)
+            for lemma, definition, cost in self.dictionary[low]:
+                output2 = dict(output)
                 for channel in self.output_channel:
                     output2[channel.name] = channel.typ(definition)
                 output2["lemma"] = lemma
-		output2[Cost.name] = Cost.typ("X" * int(cost))
-                results.add((output2,remnant))
-        if text in gazDict:
-		for english in gazDict[text]:
-			cost = 0
-		
-			for word in english.split():
-				word = word.lower()
-				if word not in self.freqDist:
-					cost += 15
-				else:
-					log_freq = -math.log(self.freqDist[word] * 1.0 / self.engWords)
-					cost += math.floor(log_freq)
-			output2 = deepcopy(output)
+                output2[Cost.name] = Cost.typ(cost)
+                results.add((HashableDict(output2),remnant))
+        if text in self.gazetteer:
+		for english, cost in self.gazetteer[text]:
+			output2 = dict(output)
 			for channel in self.output_channel:
 				output2[channel.name] = channel.typ(english)
-			output2[Cost.name] = Cost.typ("X" * int(cost))
-			results.add((output2,remnant))
+			output2[Cost.name] = Cost.typ(cost)
+			results.add((HashableDict(output2),remnant))
 #	if len(results) == 0 and normalize(low) in self.dictionary:
 #	     newText = normalize(low)
 #	     for pair in self.dictionary[newText]:
@@ -246,12 +248,12 @@ class Lookup(Parser):
 #                results.add((output2,remnant))	
 	if len(results) == 0:
             #print("didn't find it: %s" % text)
-            output2 = deepcopy(output)
+            output2 = dict(output)
             for channel in self.output_channel:
                 output2[channel.name] = channel.typ(text.replace(" ",""))
-            cost = "X" * (50 + len(text))
+            cost = 50 + len(text)
             output2[Cost.name] = Cost.typ(cost)
-            results.add((output2,remnant))
+            results.add((HashableDict(output2),remnant))
             
         return results
 
@@ -260,7 +262,7 @@ class Lookup(Parser):
 # MORPHOLOGICAL GRAMMAR
 #
 ###############################
-Cost = Concatenated("cost")
+Cost = Numeric("cost")     # an integer internally; shown as "XXX..." by parse()
 Nat = Concatenated("natural")
 #PARSER      = Lookup("orm_lexicon.txt", Tex/Mor/Lem, Glo/Cit/Nat)
 LEMMA = Lookup(("/home/data/LoReHLT17/internal/Morph/Orm/v4/orm_lexicon.txt", "/home/data/LoReHLT17/internal/Morph/Orm/v4/orm_lexicon_wikibooks.txt", "/home/data/LoReHLT17/internal/Morph/Orm/v4/lexicon_supplement.txt"), Tex/Mor/Lem, Glo/Cit/Nat)
@@ -273,26 +275,71 @@ LEMMA = Lookup(("/home/data/LoReHLT17/internal/Morph/Orm/v4/orm_lexicon.txt", "/
 
 # http start, html end
 
+# Parses can be kept in a persistent cache, shared across runs and processes; 
+# see open_parse_cache() and parse_cache.py. 
+dict_path = "/home/data/LoReHLT17/internal/Morph/Orm/v4/"
+parse_cache_file = dict_path + "orm_parses.sqlite"
+PARSE_CACHE = None
+
+def grammar_version():
+    "Digest of the source of the grammar (this file) and the parser engine."
+    return files_digest([os.path.abspath(__file__), sys.modules[Parser.__module__].__file__])
+
+def lexicon_version():
+    "Digest of the dictionaries, the gazetteers and the word list the costs depend on."
+    return files_digest(list(LEMMA.dictionaryList) + [gazetteer.name, knightFile.name, setSList.name])
+
+def open_parse_cache(filename=parse_cache_file):
+    """Keep the results of full_parses() (and so parse() and best_parse()) in a persistent 
+    cache, shared with other runs and processes using the same file.  Entries made with a 
+    different version of the grammar or the dictionaries are never returned, and are 
+    deleted when the file is opened."""
+    global PARSE_CACHE
+    if PARSE_CACHE is not None:
+        PARSE_CACHE.close()
+    PARSE_CACHE = ParseCache(filename, "orm", grammar_version(), lexicon_version())
+    atexit.register(PARSE_CACHE.close)
+    return PARSE_CACHE
+
+def parse_order(parse):
+    "Sort key for parses: by cost, with ties broken the same way every time."
+    return (parse["cost"] if "cost" in parse else 0, sorted(parse.items()))
+
+@lru_cache(maxsize=1000)
+def full_parses(word):
+    """All the parses of a word, cheapest first, each a dict from channel names to 
+    values (costs as numbers), from the parse cache if it's open."""
+    norm = normalize(word)
+    if PARSE_CACHE is not None:
+        parses = PARSE_CACHE.get(norm)
+        if parses is not None:
+            return parses
+    parses = _full_parses(norm)
+    if PARSE_CACHE is not None:
+        PARSE_CACHE.put(norm, parses)
+    return parses
+
+def _full_parses(norm):
+    "full_parses() of a normalized word, worked out afresh."
+    parses = [ dict((channel, int(value) if channel == Cost.name else unicode(value))
+                    for channel, value in p.items()) for p in PARSER.parse(norm) ]
+    parses.sort(key=parse_order)
+    return parses
+
 @lru_cache(maxsize=1000)
 def parse(word, representation_name="lemma"):
     #ipa = g2p(word)
-    
- #   if word in commonParseDict:
-#	return [unicode(item) for item in commonParseDict[word][0][channelIndexDict[representation_name]]]
-
-    parses = PARSER.parse(normalize(word))
+    parses = full_parses(word)
     #parses = PARSER.parse(ipa)
     if not parses:
         print("Warning: cannot parse %s (%s)" % (word, ipa))
-        parses = [{representation_name:ipa,"cost":""}]
-    parses.sort(key=lambda x:len(x["cost"]) if "cost" in x else 0)
+        parses = [{representation_name:ipa,"cost":0}]
     #print([x[representation_name] for x in parses])
+    if representation_name == Cost.name:    # costs are shown as strings of X's, e.g. 5 as 'XXXXX'
+        return ["X" * x[Cost.name] for x in parses]
     return [unicode(x[representation_name]) for x in parses]
 @lru_cache(maxsize=1000)
 def best_parse(word, representation_name="lemma"):
-    #if word in commonParseDict:
-#	return unicode(commonParseDict[word][1][channelIndexDict[representation_name]])    
-
     return unicode(parse(word, representation_name)[0])
 
 
@@ -465,6 +512,7 @@ VERB = VERB_STEM + ASP_AGR | VERB_STEM + INFINITIVE
 
 
 PARSER = NOUN | VERB
+PARSER = OPTIMIZER.optimize(PARSER)    # merges repeated subgrammars etc.; see morpar_orm.GrammarOptimizer
 
 #words = ["taatuun", "qilleensi", "jaballi", "afaan", "loltoonni", "namichi", "waantooti", "namichaa", "Caaltuu", "afaanii", "namichaa", "intalaaf", "sareef", "baruuf", "bishaaniif", "sareedhaa", "sareedhaaf", "Caaltuutti"]
 pairs = []
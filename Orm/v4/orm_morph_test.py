@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Checks that morpar_orm.GrammarOptimizer leaves what orm_morph's grammar parses unchanged:
+# the grammar is built without optimizing it, used on a fixed word list, and then
+# optimized and used on the words again.
+
+from __future__ import unicode_literals
+from __future__ import print_function
+from io import open
+import os
+import morpar_orm
+
+morpar_orm.OPTIMIZER.optimize = lambda parser: parser    # so that importing orm_morph leaves PARSER alone
+import orm_morph
+del morpar_orm.OPTIMIZER.optimize
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "benchmarks", "orm.txt")
+
+def parse_all(parser, words):
+    return [ set(parser.parse(orm_morph.normalize(word))) for word in words ]
+
+
+#############################
+#
+# START TESTS
+#
+#############################
+
+print("STARTING GRAMMAR OPTIMIZER TEST")
+
+with open(CORPUS, "r", encoding="utf-8") as fin:
+    words = sorted(set(fin.read().split()))
+words += [ word for word, gloss in orm_morph.pairs ]
+before = parse_all(orm_morph.PARSER, words)
+parser = morpar_orm.OPTIMIZER.optimize(orm_morph.PARSER)
+print(morpar_orm.OPTIMIZER.report())
+after = parse_all(parser, words)
+for word, old, new in zip(words, before, after):
+    assert old == new, word
+print("%d words, %d parses, all the same" % (len(words), sum(len(p) for p in before)))
@@ -43,6 +43,19 @@ def get_freq_dist():
     freq.update(brown.words())
     return freq
 
+def definition_cost(definition, freq, total):
+    """Cost of an English definition: the sum over its words of the floored negative 
+    log frequency, and 15 for each word that isn't in the frequency distribution."""
+    cost = 0
+    for word in definition.split():
+        word = word.lower()
+        if word not in freq:
+            cost += 15
+        else:
+            log_freq = -math.log(freq[word] * 1.0 / total)
+            cost += math.floor(log_freq)
+    return int(cost)
+
 epi = epitran.Epitran("tir-Ethi")
 g2p = epi.transliterate
 
@@ -66,11 +79,15 @@ def get_dictionary(dict_filename):
 class Lookup(Parser):
 
     def __init__(self, dictionary, channel=None, output_channel=None):
-        self.dictionary = get_dictionary(dictionary)
         self.channel = channel
         self.output_channel = output_channel
-        self.freqDist = get_freq_dist()
-        self.engWords = self.freqDist.N()
+        # work out each definition's cost once, rather than on every lookup
+        freqDist = get_freq_dist()
+        engWords = freqDist.N()
+        self.dictionary = {}
+        for ipa, definitions in get_dictionary(dictionary).items():
+            self.dictionary[ipa] = [ (definition, definition_cost(definition, freqDist, engWords))
+                                     for definition in definitions ]
     
     @lru_cache(maxsize=1000)
     def __call__(self, input, input_channel=None, leftward=False):
@@ -88,19 +105,11 @@ class Lookup(Parser):
             output[channel.name] = channel.typ(text)    
                 
         if text in self.dictionary:
-            for definition in self.dictionary[text]:
-                cost = 0
-                for word in definition.split():
-                    word = word.lower()
-                    if word not in self.freqDist:
-                        cost += 15
-                    else:
-                        log_freq = -math.log(self.freqDist[word] * 1.0 / self.engWords)
-                        cost += math.floor(log_freq)
+            for definition, cost in self.dictionary[text]:
                 output2 = deepcopy(output)
                 for channel in self.output_channel:
                     output2[channel.name] = channel.typ(definition)
-                output2[Cost.name] = Cost.typ("X" * int(cost))
+                output2[Cost.name] = Cost.typ("X" * cost)
                 results.add((output2,remnant))
         else:
             #print("didn't find it: %s" % text)
@@ -8,6 +8,7 @@ from io import open
 import epitran
 import sys, json, glob, os, math
 from copy import deepcopy
+from itertools import islice
 from morpar import *
 import nltk
 from nltk.probability import *
@@ -432,33 +433,33 @@ if __name__ == '__main__':
 """
 
 def testfile(f, printall=True):
-    wlines = open(f, encoding="utf8").readlines()
-    for wline in (wlines):
-        if wline.startswith("#"): continue
-        w = wline.strip().split()[0]
-        print(w, g2p(w))
-        g = returngloss(w)
-        if (eng_found(g) == 'LOOKUP_FALSE' or printall):
-            testprint_ipa(g2p(w))    
+    with open(f, encoding="utf8") as fin:
+        for wline in fin:
+            if wline.startswith("#"): continue
+            w = wline.strip().split()[0]
+            print(w, g2p(w))
+            g = returngloss(w)
+            if (eng_found(g) == 'LOOKUP_FALSE' or printall):
+                testprint_ipa(g2p(w))    
 
 def testit():
     testfile("testit.txt")         
 
 success = []
 def test1000(num=1000, quiet=True, flip=False):
-    lines = open("../mor/count_tir_gloss.SORTED2.top1K.txt", encoding="utf8").readlines()
-    words = [tuple(x.split()[:3]) for x in lines]
     count = 0
     tokcount = 0
-    for (c, w, ipa)  in words[:num]:
-        g = returngloss(w)
-        if eng_found(g) == 'LOOKUP_TRUE' or ipa in preparsed:
-              if not flip and not quiet: print(c, w, ipa, g)
-              count += 1
-              tokcount += int(c)
-              success.append(ipa)
-        else:
-            if flip and not quiet: print(c, w, ipa, g)
+    with open("../mor/count_tir_gloss.SORTED2.top1K.txt", encoding="utf8") as fin:
+        for line in islice(fin, num):
+            (c, w, ipa) = line.split()[:3]
+            g = returngloss(w)
+            if eng_found(g) == 'LOOKUP_TRUE' or ipa in preparsed:
+                  if not flip and not quiet: print(c, w, ipa, g)
+                  count += 1
+                  tokcount += int(c)
+                  success.append(ipa)
+            else:
+                if flip and not quiet: print(c, w, ipa, g)
     print("%d new types" % count)
     print("adds up to total %d tokens, %.2f percent of total tokens." % (tokcount, float(tokcount)/572497 * 100))
 
@@ -487,13 +488,12 @@ def process_freq():
               
 
 def testwiki(): 
-    wiki_lines = open('testwiki.txt', encoding='utf8').readlines()
-    wiki_lines = [l for l in wiki_lines if not l.startswith("#")]
-    wiki_words = ' '.join(wiki_lines).split()
-
-    for w in wiki_words:
-        g = returngloss(w)
-        print(w, g2p(w), g, sep="\t")
+    with open('testwiki.txt', encoding='utf8') as fin:
+        for l in fin:
+            if l.startswith("#"): continue
+            for w in l.split():
+                g = returngloss(w)
+                print(w, g2p(w), g, sep="\t")
 
 
     # 572497 all tokens, 113816 all types
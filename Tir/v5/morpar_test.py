@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+from __future__ import print_function
+from morpar import *
+
+
+#############################
+#
+# START TESTS
+#
+#############################
+
+Cost = Numeric("cost")
+W = Tex/Mor/Glo
+
+def top_parses(parses, top):
+    "The parses that cost no more than the top'th cheapest."
+    costs = sorted(p["cost"] for p in parses)
+    if not costs:
+        return []
+    last = costs[min(top, len(costs)) - 1]
+    return sorted(p for p in parses if p["cost"] <= last)
+
+def check_cheapest(parser, words, top):
+    ''' parse_cheapest() has to return every one of the top parses that parse() does,
+        and nothing that parse() doesn't. '''
+    for word in words:
+        parses = parser.parse(word)
+        cheapest = parser.parse_cheapest(word, top, Cost, ceiling=1)
+        print(word, len(parses), len(cheapest))
+        assert all(p in parses for p in cheapest), word
+        assert top_parses(cheapest, top) == top_parses(parses, top), word
+
+
+print("STARTING COST-BOUNDED SEARCH TEST")
+
+ROOT = W("kat") + Cost(1) | W("ka") + Cost(2) | Guess(W) + Cost(10)
+SUF = W("s") + Cost(1) | W("ts") + Cost(3) | W("ats") + Cost(4) | NULL
+WORDS = ["kats", "kat", "katats", "kas", "bits", "s", "ab"]
+check_cheapest(ROOT << SUF, WORDS, 1)
+check_cheapest(ROOT << SUF, WORDS, 3)
+
+print()
+print("STARTING COST-BOUNDED NEGATION TEST")
+
+# The ceiling mustn't prune what a Negation tests for: a costly parse of it still counts
+check_cheapest(Guess(W) + Cost(1) + ~(W("ab") + Cost(100)), WORDS, 1)
+check_cheapest(ROOT << (~(W("ts") + Cost(100)) + SUF), WORDS, 3)
+
+print()
+print("STARTING GRAMMAR OPTIMIZER TEST")
+
+# The same suffixes built twice, a duplicate alternative, and NULL sequences
+SUF1 = W("s") + Cost(1) | W("ts") + Cost(3) | W("s") + Cost(1) | NULL
+SUF2 = (W("s") + Cost(1) | W("ts") + Cost(3)) + NULL | NULL
+PARSER = (ROOT << SUF1) | (ROOT << (~(W("ts") + Cost(100)) + SUF2)) | NULL + ROOT
+before = [ sorted(PARSER.parse(word)) for word in WORDS ]    # fills the Choices' gates, too
+PARSER = OPTIMIZER.optimize(PARSER)
+print(OPTIMIZER.report())
+assert OPTIMIZER.after < OPTIMIZER.before
+stack = [PARSER]
+while stack:    # no Choice keeps the gates it made from its old alternatives
+    node = stack.pop()
+    assert not isinstance(node, Choice) or not node.compiled
+    stack += [ getattr(node, attr) for attr in OPTIMIZER.children(node) ]
+after = [ sorted(PARSER.parse(word)) for word in WORDS ]
+for word, old, new in zip(WORDS, before, after):
+    print(word, len(old), len(new))
+    assert old == new, word
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# A persistent cache of parses, shared across runs and processes, kept in an
+# SQLite file.  Entries are keyed by (language, grammar version, lexicon
+# version, token); the grammar and lexicon versions are digests of the files
+# they come from, so that when either changes, the old entries no longer
+# match, and are deleted the next time the cache is opened.
+
+from __future__ import print_function
+from __future__ import unicode_literals
+import hashlib, json, os, sqlite3, sys
+
+def log_error(*args, **kwargs):
+    print(*args, file=sys.stderr, **kwargs)
+
+def files_digest(filenames):
+    ''' MD5 hex digest of the contents of the given files, taken together; a file that
+        can't be read counts as empty.  Compiled modules (.pyc) are read from their source. '''
+    md5 = hashlib.md5()
+    for filename in filenames:
+        if filename.endswith(".pyc"):
+            filename = filename[:-1]
+        try:
+            with open(filename, "rb") as fin:
+                md5.update(fin.read())
+        except IOError:
+            pass
+    return md5.hexdigest()
+
+class ParseCache(object):
+    ''' A map from tokens to their parses (anything JSON can represent), for one
+        language and one version of its grammar and lexicon.
+
+        Any number of processes can read and write the same file at once; SQLite
+        takes care of the locking.  New entries are held back and written together,
+        COMMIT_EVERY at a time and when the cache is closed, so a process that is
+        killed can lose its last few entries, but never leaves a bad one. '''
+
+    COMMIT_EVERY = 500
+    TIMEOUT = 60.0    # seconds to wait for another process's lock
+
+    def __init__(self, filename, language, grammar_version, lexicon_version):
+        self.filename = filename
+        self.language = language
+        self.grammar_version = grammar_version
+        self.lexicon_version = lexicon_version
+        self.hits = 0
+        self.misses = 0
+        self._db = None
+        self._pid = None
+        self._pending = []    # rows not yet written
+
+    def connection(self):
+        # connections can't be shared with forked processes, so each process opens its own
+        if self._db is None or self._pid != os.getpid():
+            self._db = sqlite3.connect(self.filename, timeout=self.TIMEOUT)
+            self._pid = os.getpid()
+            self._db.execute("PRAGMA journal_mode=WAL")    # readers don't wait for writers
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS parses ("
+                             "language TEXT, grammar TEXT, lexicon TEXT, token TEXT, parses TEXT, "
+                             "PRIMARY KEY (language, grammar, lexicon, token))")
+            self._db.execute("DELETE FROM parses WHERE language = ? AND (grammar != ? OR lexicon != ?)",
+                             (self.language, self.grammar_version, self.lexicon_version))
+            self._db.commit()
+        return self._db
+
+    def get_many(self, tokens):
+        "Returns a dict from those of the tokens that are in the cache to their parses."
+        found = {}
+        tokens = list(set(tokens))
+        try:
+            db = self.connection()
+            for i in range(0, len(tokens), 500):    # SQLite limits the number of parameters
+                batch = tokens[i:i+500]
+                rows = db.execute("SELECT token, parses FROM parses WHERE language = ? AND grammar = ? "
+                                  "AND lexicon = ? AND token IN (%s)" % ",".join("?" * len(batch)),
+                                  [self.language, self.grammar_version, self.lexicon_version] + batch)
+                for token, parses in rows:
+                    found[token] = json.loads(parses)
+        except sqlite3.Error as e:    # the cache is only an optimization; parse as usual
+            log_error("WARNING: Could not read from parse cache %s: %s" % (self.filename, e))
+        self.hits += len(found)
+        self.misses += len(tokens) - len(found)
+        return found
+
+    def get(self, token, default=None):
+        return self.get_many([token]).get(token, default)
+
+    def put_many(self, items):
+        "Stores (token, parses) pairs."
+        self._pending += [ (self.language, self.grammar_version, self.lexicon_version, token,
+                            json.dumps(parses, ensure_ascii=False)) for token, parses in items ]
+        if len(self._pending) >= self.COMMIT_EVERY:
+            self.commit()
+
+    def put(self, token, parses):
+        self.put_many([(token, parses)])
+
+    def commit(self):
+        "Writes the stored pairs out, in one short transaction."
+        if not self._pending:
+            return
+        try:
+            db = self.connection()
+            with db:
+                db.executemany("INSERT OR REPLACE INTO parses VALUES (?, ?, ?, ?, ?)", self._pending)
+        except sqlite3.Error as e:    # e.g. a read-only file: the cache is only an optimization
+            log_error("WARNING: Could not write to parse cache %s: %s" % (self.filename, e))
+        self._pending = []
+
+    def close(self):
+        self.commit()
+        if self._db is not None and self._pid == os.getpid():
+            self._db.close()
+        self._db = None
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
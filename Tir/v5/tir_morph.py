@@ -5,29 +5,29 @@
 # incorporates noun internal plural morphology
 # output in tir-Ethi-pp (still using tir-Ethi internally)
 # new and updated user-facing functions:
-#    fullparse, best_fullparse, parse, best_parse
+#    fullparse, best_fullparse, parse, best_parse, fullparse_many
+#    open_parse_cache, to keep parses across runs
+#    build_frequent_table, to precompute the parses of frequent words
 
 from __future__ import print_function
 from __future__ import unicode_literals
 
 from io import open
-import sys, json, glob, os, math
-from copy import deepcopy
+import sys, json, glob, os, math, hashlib, atexit
 from morpar import *
-import nltk
-from nltk.probability import *
-try:
-    nltk.data.find('corpora/brown')
-except LookupError:
-    nltk.download('brown')
-from nltk.corpus import brown
+from parse_cache import ParseCache, files_digest
+from translit import Transliterator
 
 try:
     from functools import lru_cache
 except ImportError:
     from functools32 import lru_cache
 
-import lxml.etree as ET
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
 from collections import defaultdict
 import re
 
@@ -38,32 +38,48 @@ def log_error(*args, **kwargs):
 #
 # EPITRAN, DICTIONARY FILE PATHS
 #
+# Nothing here is loaded at import time;
+# the TirMorph engine below builds the 
+# Epitran instances, the frequency list 
+# and the dictionaries on first use. 
+#
 ######################################
 
 #dict_path = "/home/data/LoReHLT17/internal/Morph/Tir/v5/" # on miami
 dict_path = "/usr2/data/shared/LoReHLT17/internal/Morph/Tir/v5/"  # on lor
 #dict_path = "D:\\Projects\\LORELEI Surprise Language\\morphology\\v5\\"
 
+# Compiled dictionaries are cached here; see load_lexicons() below. 
+lexicon_cache_file = dict_path + "tir_lexicon.cache"
+
+# fullparse() results can be kept here, if asked; see open_parse_cache() below. 
+parse_cache_file = dict_path + "tir_parses.sqlite"
+
+# All the parses of the most frequent words, if built; see build_frequent_table() below. 
+frequent_table_file = dict_path + "tir_frequent.table"
+
 # output IPA format: True (tir-Ethi-pp), False (tir-Ethi which is used internally)
 # ***** Make sure that pre-parsed files are also in the right format!! *****
 out_tir_pp = True  
 
-import epitran
 # original mapping: only token-final ɨ removed
 # single-char geez script 'tɨ' returned as 't' in an earlier version. 
-g2p = epitran.Epitran("tir-Ethi").transliterate 
+def g2p(txt):
+    return ENGINE.g2p(txt)
 
 # precision-phonemic: some ɨ removed internally, rendeing CC.  
 # in a later version, single-char-final 'ɨ' not chopped, so 'tɨ' returned
-g2pp = epitran.Epitran("tir-Ethi-pp").transliterate 
-                
-from epitran.tir2pp import Tir2PP
-t2p = Tir2PP()
+def g2pp(txt):
+    return ENGINE.g2pp(txt)
+
 #p2pp = t2p.apply     # converts original p output to pp output.
                       # Nope, is a problem for multi-word input:
                       # "tɨɡɨrɨɲa tɨɡɨrɨɲa"  ->  "tɨɡrɨɲa tɡɨrɲa"
 # tokenize, convert each token, and stitch them back 
-p2pp = lambda txt: ' '.join([t2p.apply(x) for x in txt.split()])
+# Memoized: Lookup converts the same guessed stems over and over. 
+@lru_cache(maxsize=100000)
+def p2pp(txt):
+    return ' '.join([ENGINE.t2p.apply(x) for x in txt.split()])
     
 ######################################
 #
@@ -71,12 +87,12 @@ p2pp = lambda txt: ' '.join([t2p.apply(x) for x in txt.split()])
 #
 ######################################
 
-Text = Concatenated('text')
+Text = Segmented('text')    # IPA, compared a segment at a time (see morpar.SegmentedStr)
 Breakdown = Hyphenated('breakdown')
 Aff = Text / Breakdown
 Def = Concatenated("definition")
 Nat = Concatenated("natural")
-Cost = Concatenated("cost")
+Cost = Numeric("cost")     # an integer internally; render_cost() turns it into "XXX..." for the API
 Gloss = Hyphenated("gloss")
 Lemma = Concatenated("lemma")
 Lem = Text / Breakdown / Gloss / Lemma / Def / Nat
@@ -89,22 +105,41 @@ DEFAULTS.Lem = Lem
 # DICTIONARY BUILDING
 #
 # This section builds three dictionary
-# objects from various dictionary files. 
+# objects from various dictionary files,
+# or loads them from a cache file if 
+# none of the files has changed since.
 #
 ######################################
 
 setSfile = dict_path+"setS_wordlist.txt"
-setSWords = open(setSfile, "r", encoding="utf8").read().split()
         
-def get_freq_dist():
+def get_freq_dist(words=()):
+    "English word frequencies from the Brown corpus, plus the given words."
+    import nltk
+    from nltk.probability import FreqDist
+    try:
+        nltk.data.find('corpora/brown')
+    except LookupError:
+        nltk.download('brown')
+    from nltk.corpus import brown
     freq = FreqDist()
     freq.update(brown.words())
-    freq.update(setSWords)
+    freq.update(words)
     return freq
 
-l1_to_l2 = defaultdict(list)    # dictionary at top level, so it can be referenced
-ncroot_to_l2 = defaultdict(list)
-    
+def definition_cost(definition, freq, total):
+    """Cost of an English definition: the sum over its words of the floored negative 
+    log frequency, and 15 for each word that isn't in the frequency distribution."""
+    cost = 0
+    for word in definition.split():
+        word = word.lower()
+        if word not in freq:
+            cost += 15
+        else:
+            log_freq = -math.log(freq[word] * 1.0 / total)
+            cost += math.floor(log_freq)
+    return int(cost)
+
 def make_dictionary(dict_filename_list, outdict):
     for dict_filename in dict_filename_list:
         try:
@@ -143,17 +178,19 @@ def make_root_dictionary(dict_filename_list, outdict):
 
 def make_trivial_parse(br, le, gl, na, df, co):
     "Build and return a trivial parse from provided text values."
-    prs = HashableDict()
+    prs = {}
     prs['breakdown'] = Breakdown.typ(br)
     prs['lemma'] = Lemma.typ(le)
     prs['gloss'] = Gloss.typ(gl)
     prs['natural'] = Nat.typ(na)
     prs['definition'] = Def.typ(df)
-    prs['cost'] = Def.typ(co)
-    return prs
+    prs['cost'] = Cost.typ(co)
+    return HashableDict(prs)
 
 def process_preparsed_dict(dict_filename_list):
     # Wow. What a mess. Might have to re-format the PREPARSED text files. 
+    # Values are lists of (breakdown, lemma, gloss, natural, defin, cost) rows,
+    # which make_preparsed_parses() turns into parses.  
     preparsed = defaultdict(list)
 
     for dict_filename in dict_filename_list :
@@ -189,11 +226,17 @@ def process_preparsed_dict(dict_filename_list):
                         lemma = g2pp(lemma) if out_tir_pp else g2p(lemma)       # tir-Epi-pp conversion          
 
                     #preparsed[ipa] = [{'breakdown':breakdown, 'lemma':lemma, 'gloss':gloss, 'natural':natural}]
-                    preparsed[ipa] = [ make_trivial_parse(breakdown, lemma, gloss, natural, defin, cost) ]
+                    preparsed[ipa] = [ (breakdown, lemma, gloss, natural, defin, cost) ]
         except IOError:
             log_error(dict_filename, "was not found. Please let Na-Rae know.")
             continue
     return preparsed
+
+def make_preparsed_parses(preparsed_rows):
+    preparsed = defaultdict(list)
+    for ipa, rows in preparsed_rows.items():
+        preparsed[ipa] = [ make_trivial_parse(*row) for row in rows ]
+    return preparsed
             
 # Below are dictionary files. First two fields are absolutely necessary: eng_definition, tir_word.
 # 3rd column is IPA, in tir-Ethi. Not utilized by this module; it's for human readability only. 
@@ -203,14 +246,182 @@ dict_list = [dict_path+"IL5_dictionary_1.txt", dict_path+"IL5_dictionary_2.txt",
              dict_path+"IL5_dictionary_7_DLIFLC.txt", 
              dict_path+"tir_gaz.txt", 
              dict_path+"lexicon_supplement.txt" ]  
-make_dictionary(dict_list, l1_to_l2)
 
 # noun consonant roots, for internal plural. No vowels, lists CCC only. 
-make_root_dictionary([dict_path+"noun-consonant-roots.txt"], ncroot_to_l2)
+dict_ncroot = [dict_path+"noun-consonant-roots.txt"]
 
 # These files list fully parsed entries. 
 dict_preparsed = [dict_path+"IL5_PREPARSED_hornmorpho.tsv", dict_path+"IL5_PREPARSED.tsv"] # order! 
-preparsed = process_preparsed_dict(dict_preparsed)
+
+# Bump this whenever the dictionary-building code above changes, so that
+# caches built by the old code are rebuilt. 
+LEXICON_CACHE_VERSION = 4
+
+def file_digest(filename):
+    "MD5 hex digest of a file's contents, or None if it can't be read."
+    try:
+        with open(filename, "rb") as fin:
+            return hashlib.md5(fin.read()).hexdigest()
+    except IOError:
+        return None
+
+def lexicon_cache_key():
+    """Everything the compiled dictionaries depend on: the cache format version,
+    the output IPA format, the Epitran version, and the contents of every source file
+    (including setS_wordlist, which the definition costs depend on)."""
+    import epitran
+    sources = dict_list + dict_ncroot + dict_preparsed + [setSfile]
+    return ( LEXICON_CACHE_VERSION, out_tir_pp, getattr(epitran, "__version__", None),
+             tuple((os.path.basename(f), file_digest(f)) for f in sources) )
+
+def build_lexicons():
+    """Build (l1_to_l2, ncroot_to_l2, preparsed rows, transliteration tables, pp forms)
+    from the dictionary files.  Each definition is stored with its cost, and each headword
+    with its tir-Ethi-pp form, so that Lookup doesn't have to work them out.  The transliteration tables are those of g2p and g2pp, checked against
+    Epitran on every word in the dictionaries (see translit.py)."""
+    l1_to_l2 = defaultdict(list)
+    ncroot_to_l2 = defaultdict(list)
+    make_dictionary(dict_list, l1_to_l2)
+    make_root_dictionary(dict_ncroot, ncroot_to_l2)
+    preparsed_rows = process_preparsed_dict(dict_preparsed)
+
+    costs = {}    # many definitions recur across entries and files
+    def cost(definition):
+        if definition not in costs:
+            costs[definition] = definition_cost(definition, ENGINE.freq_dist, ENGINE.freq_total)
+        return costs[definition]
+    for ipa, definitions in l1_to_l2.items():
+        l1_to_l2[ipa] = [ (defin, cost(defin)) for defin in definitions ]
+    for root, entries in ncroot_to_l2.items():
+        ncroot_to_l2[root] = [ (fullroot, defin, cost(defin)) for fullroot, defin in entries ]
+
+    pp_forms = {}
+    for ipa in list(l1_to_l2) + list(ncroot_to_l2):
+        pp_forms[ipa] = p2pp(ipa)
+
+    words = list(ENGINE.g2p.memo)    # every word in the dictionaries
+    tables = (ENGINE.g2p.verify(), ENGINE.g2pp.verify(words))
+    return l1_to_l2, ncroot_to_l2, preparsed_rows, tables, pp_forms
+
+def save_lexicon_cache(key, lexicons, cache_file=lexicon_cache_file):
+    # write to a temporary file and rename, so concurrent readers never see half a file
+    tmp_file = "%s.%d.tmp" % (cache_file, os.getpid())
+    try:
+        with open(tmp_file, "wb") as fout:
+            pickle.dump(key, fout, 2)
+            pickle.dump(lexicons, fout, 2)
+        os.rename(tmp_file, cache_file)
+    except (IOError, OSError) as e:
+        log_error("WARNING: Could not write lexicon cache %s: %s" % (cache_file, e))
+
+def load_lexicons(cache_file=lexicon_cache_file, rebuild=False):
+    """Returns (l1_to_l2, ncroot_to_l2, preparsed rows, transliteration tables, pp forms), from the cache file if it was
+    built from the current dictionary files, or else by building them (and caching them)."""
+    key = lexicon_cache_key()
+    if not rebuild:
+        try:
+            with open(cache_file, "rb") as fin:
+                if pickle.load(fin) == key:
+                    return pickle.load(fin)
+        except Exception:    # missing, truncated, or from an incompatible version: rebuild
+            pass
+    lexicons = build_lexicons()
+    save_lexicon_cache(key, lexicons, cache_file)
+    return lexicons
+
+######################################
+#
+# ENGINE
+#
+# The resources above, built once on 
+# first use and shared by the parsers
+# and functions below. 
+#
+######################################
+
+class lazy_property(object):
+    "A property that is computed on first access, then stored on the instance."
+
+    def __init__(self, func):
+        self.func = func
+        self.__doc__ = func.__doc__
+
+    def __get__(self, obj, cls):
+        if obj is None:
+            return self
+        value = obj.__dict__[self.func.__name__] = self.func(obj)
+        return value
+
+class TirMorph(object):
+    """Holds the Epitran transliterators, the English frequency distribution and 
+    the dictionaries.  Each is built the first time it's asked for, so that 
+    importing this module is cheap, and shared by every parser afterwards."""
+
+    parse_cache = None    # a ParseCache, once open_parse_cache() is called
+
+    def load(self):
+        "Build all resources now, rather than on first use."
+        for name in ("g2p", "g2pp", "t2p", "l1_to_l2", "ncroot_to_l2", "pp_forms", "preparsed", "frequent"):
+            getattr(self, name)
+        return self
+
+    # Until the dictionaries are loaded, along with their verified tables, these
+    # pass every word to Epitran.
+    @lazy_property
+    def g2p(self):
+        import epitran
+        return Transliterator(epitran.Epitran("tir-Ethi").transliterate)
+
+    @lazy_property
+    def g2pp(self):
+        import epitran
+        return Transliterator(epitran.Epitran("tir-Ethi-pp").transliterate)
+
+    @lazy_property
+    def t2p(self):
+        from epitran.tir2pp import Tir2PP
+        return Tir2PP()
+
+    # only needed to (re)build the dictionaries
+    @lazy_property
+    def freq_dist(self):
+        with open(setSfile, "r", encoding="utf8") as fin:
+            return get_freq_dist(fin.read().split())
+
+    @lazy_property
+    def freq_total(self):
+        return self.freq_dist.N()
+
+    @lazy_property
+    def lexicons(self):
+        lexicons = load_lexicons()
+        g2p_table, g2pp_table = lexicons[3]
+        self.g2p.set_table(g2p_table)
+        self.g2pp.set_table(g2pp_table)
+        return lexicons
+
+    @lazy_property
+    def l1_to_l2(self):
+        return self.lexicons[0]
+
+    @lazy_property
+    def ncroot_to_l2(self):
+        return self.lexicons[1]
+
+    # the tir-Ethi-pp form of each headword in l1_to_l2 and ncroot_to_l2
+    @lazy_property
+    def pp_forms(self):
+        return self.lexicons[4]
+
+    @lazy_property
+    def preparsed(self):
+        return make_preparsed_parses(self.lexicons[2])
+
+    @lazy_property
+    def frequent(self):
+        return load_frequent_table()
+
+ENGINE = TirMorph()
 
 ######################################
 #
@@ -224,67 +435,66 @@ preparsed = process_preparsed_dict(dict_preparsed)
 
 class Lookup(Parser):
 
-    def __init__(self, di, channel=None, output_channel=None, process_root=False):
-        self.dictionary = di
+    def __init__(self, di, channel=None, output_channel=None, process_root=False, engine=None):
+        self.dictionary_name = di    # name of a TirMorph dictionary, e.g. "l1_to_l2"
         self.channel = channel
         self.output_channel = output_channel
-        self.freqDist = get_freq_dist()
-        self.engWords = self.freqDist.N()
+        self.engine = engine or ENGINE
         self.procroot = process_root
 
         # channel: Text/Breakdown/Lemma, output_channel: Gloss/Nat        
+
+    # The engine's resources are only built when the parser first runs.
+    @property
+    def dictionary(self):
+        return getattr(self.engine, self.dictionary_name)
     
-    @lru_cache(maxsize=1000)
+    @memoized_method
     def __call__(self, input, input_channel=None, leftward=False):
         results = set()
 
         text = input[input_channel.name]
         text = text.strip()
         
-        output = HashableDict()
+        output = {}
         remnant = HashableDict({input_channel.name:input_channel.typ()})
+        found = text in self.dictionary
         
+        ipaout = text
+        if out_tir_pp:    # conversion to 'tir-Ethi-pp', done in advance for headwords
+            ipaout = self.engine.pp_forms[text] if found else p2pp(text)
         for channel in self.channel:
             if channel == input_channel:
                 continue
-            ipaout = text
-            if out_tir_pp: ipaout = p2pp(ipaout)    # conversion to 'tir-Ethi-pp'
             output[channel.name] = channel.typ(ipaout)
             
-        if text in self.dictionary:
-            for defin in self.dictionary[text]:
-                definition = defin
+        if found:
+            for entry in self.dictionary[text]:
                 fullroot = ''        # will be unused unless processing root dictionary 
                 if self.procroot:    # processing a root dictionary     
-                    fullroot, definition  = defin[0], defin[1]  # (fullroot, engword) is value
-                cost = 0
-                for word in definition.split():
-                    word = word.lower()
-                    if word not in self.freqDist:
-                        cost += 15
-                    else:
-                        log_freq = -math.log(self.freqDist[word] * 1.0 / self.engWords)
-                        cost += math.floor(log_freq)
-                output2 = deepcopy(output)
+                    fullroot, definition, cost = entry  # (fullroot, engword, cost) is value
+                else:
+                    definition, cost = entry            # costs precomputed by build_lexicons()
+                output2 = dict(output)
                 for channel in self.output_channel:
                     output2[channel.name] = channel.typ(definition)
-                output2[Cost.name] = Cost.typ("X" * int(cost))
+                output2[Cost.name] = Cost.typ(cost)
                 if self.procroot:                              # if processing a root dict
                     output2[Lemma.name] = Lemma.typ(fullroot)  # provide fullroot as lemma, not CCC 
                     #output2[Breakdown.name] = Breakdown.typ(fullroot)  # nope, no need
                     #output2[Gloss.name] = Gloss.typ(fullroot)          # likewise
-                results.add((output2,remnant))
+                results.add((HashableDict(output2),remnant))
         else:
             #print("didn't find it: %s" % text)
-            output2 = deepcopy(output)
+            output2 = dict(output)
+            ipaout = text.replace(" ","")
+            if out_tir_pp: ipaout = p2pp(ipaout)  # conversion to 'tir-Ethi-pp'
             for channel in self.output_channel:
-                ipaout = text.replace(" ","")
-                if out_tir_pp: ipaout = p2pp(ipaout)  # conversion to 'tir-Ethi-pp'
                 output2[channel.name] = channel.typ(ipaout)
-            cost = "X" * (50 + len(text))
+            cost = 50 + len(text)
             output2[Cost.name] = Cost.typ(cost)
             output2[Def.name] = channel.typ("")    # word not found; definition empty
-            results.add((output2,remnant))
+            results.add((HashableDict(output2),remnant))
             
         return results
     
@@ -471,7 +681,7 @@ MERGE = ( Mutate('kɨʔa', 'kə') | Mutate('mɨʔa', 'mə') | Mutate('zɨʔa', '
         | Mutate('bɨʔa', 'bə') | Mutate('nɨʔa', 'nə')
         | NULL) 
 
-ROOT   = Lookup(l1_to_l2, Text/Breakdown/Lemma, Gloss/Nat/Def, False)
+ROOT   = Lookup("l1_to_l2", Text/Breakdown/Lemma, Gloss/Nat/Def, False)
 #ROOT = Guess(Lem)   # SWITCH FOR GRAMMAR BUILDING!! 
 
 #======================================================= INTERNAL PLURAL STUFF
@@ -563,7 +773,7 @@ PLU_PATTERN_ALL = ( Tex(plpat1) + Gloss("PL") + Nat("Multiple-(.*)") + Cost("XXX
 
 # 3043 total eligible (3-consonant) noun roots, 1845 consonant skeletons.
 #     <--- ambiguity ratio of 1.65. Not as bad as I thought.    
-NCROOT = Lookup(ncroot_to_l2, Text/Breakdown/Lemma, Gloss/Nat/Def, process_root=True)
+NCROOT = Lookup("ncroot_to_l2", Text/Breakdown/Lemma, Gloss/Nat/Def, process_root=True)
 N_INT_PLU = NCROOT << PLU_PATTERN_ALL
 
 #========================================================= END Internal plural stuff
@@ -575,6 +785,7 @@ CLITICS = (POSS | PRONCLITIC_OBLIQ | PRONCLITIC_OBJ)
 MATRIX = (TENSE|PREP|VDERIV_PREF) >> (ROOT|N_INT_PLU) << NUMBER << CLITICS << NEG << (CASE_SUF|ADJECTIVAL|NOMINAL|CONJ_SUF)
 # PARSER = MERGE >> (REL|CONJ_PREF) >> MATRIX << TRUNC_FINAL_I
 PARSER = MERGE >> (REL|CONJ_PREF) >> MATRIX
+PARSER = OPTIMIZER.optimize(PARSER)    # merges repeated subgrammars etc.; see morpar.GrammarOptimizer
 #PARSER = (REL|CONJ) >> MATRIX 
 # integrating two yields error for ዝክርን zɨkɨrɨn. Cannot do PARSER = REL >> FUT >> ROOT 
 
@@ -594,6 +805,104 @@ def is_ascii_token(tok):
         return True
     else: return False
 
+def render_cost(parse):
+    "Parses carry integer costs; users get them as strings of X's, e.g. 5 as 'XXXXX'."
+    if "cost" not in parse:
+        return parse
+    return parse.with_value("cost", "X" * parse["cost"])
+
+# Cost-bounded search (see Parser.parse_cheapest) finds the same top parses without 
+# enumerating all of them. With this grammar it doesn't pay yet: the affixes are cheap 
+# and most of a parse's cost comes from the stem lookup at the very end, so there's 
+# little to prune, and ambiguous words come out about twice as slow. Hence off by default. 
+bounded_search = False
+
+def parse_ipa(ipa, top=3, guess=True):
+    """Parses of an IPA string. With bounded_search and top (and guess), only the top 
+    cheapest are sure to be among them."""
+    if bounded_search and top and guess:
+        # slack: whole-word parses get up to 2 taken off their cost afterwards
+        return PARSER.parse_cheapest(ipa, top, Cost, slack=2, ceiling=64)
+    return PARSER.parse(ipa)
+
+# The grammar (this file), the parser engine and the transliterator, found while 
+# the paths they were imported by still hold. 
+grammar_sources = [os.path.abspath(__file__)] + [os.path.abspath(sys.modules[c.__module__].__file__)
+                                                 for c in (Parser, Transliterator)]
+
+def grammar_version():
+    "Digest of the source of the grammar, the parser engine and the transliterator."
+    return files_digest(grammar_sources)
+
+def lexicon_version():
+    "Digest of lexicon_cache_key(), which covers everything the dictionaries are built from."
+    return hashlib.md5(repr(lexicon_cache_key()).encode("utf-8")).hexdigest()
+
+def open_parse_cache(filename=parse_cache_file):
+    """Keep the results of fullparse() and fullparse_many() in a persistent cache,
+    shared with other runs and processes using the same file (see parse_cache.py).
+    Entries made with a different version of the grammar or the dictionaries are
+    never returned, and are deleted when the file is opened."""
+    if ENGINE.parse_cache is not None:
+        ENGINE.parse_cache.close()
+    ENGINE.parse_cache = ParseCache(filename, "tir", grammar_version(), lexicon_version())
+    atexit.register(ENGINE.parse_cache.close)
+    return ENGINE.parse_cache
+
+# Cached parses are stored as rows of channel values, in make_trivial_parse() order. 
+CACHE_CHANNELS = ("breakdown", "lemma", "gloss", "natural", "definition", "cost")
+
+def parse_to_row(parse):
+    return [ unicode(parse[channel]) for channel in CACHE_CHANNELS ]
+
+def parse_from_row(row):
+    return render_cost(make_trivial_parse(*row))
+
+def read_frequency_list(freq_filename):
+    """{word: count} from a frequency list: either lines of "count word ...", like
+    count_tir_gloss.SORTED2, or plain text (e.g. a word list), where every token counts once."""
+    counts = defaultdict(int)
+    with open(freq_filename, "r", encoding="utf8") as fin:
+        for line in fin:
+            parts = line.split()
+            if len(parts) > 1 and parts[0].isdigit():
+                counts[parts[1]] += int(parts[0])
+            else:
+                for word in parts:
+                    counts[word] += 1
+    return counts
+
+def build_frequent_table(freq_filename, n=20000, table_file=frequent_table_file):
+    """Parses the n most frequent words of a frequency list and saves all their parses, 
+    ranked, in table_file, where fullparse() will find them instead of parsing them again.
+    The table is only used with the grammar and dictionaries it was built from."""
+    counts = read_frequency_list(freq_filename)
+    words = sorted(counts, key=lambda word: (-counts[word], word))[:n]
+    table = dict( (word, [ parse_to_row(p) for p in _fullparse(word, top=0) ]) for word in words )
+    tmp_file = "%s.%d.tmp" % (table_file, os.getpid())
+    with open(tmp_file, "wb") as fout:
+        pickle.dump((grammar_version(), lexicon_version()), fout, 2)
+        pickle.dump(table, fout, 2)
+    os.rename(tmp_file, table_file)
+    log_error("Saved the parses of %d words in %s" % (len(table), table_file))
+    return table
+
+def load_frequent_table(table_file=frequent_table_file):
+    """{word: parse rows} from a table saved by build_frequent_table(), or {} if there's
+    none, or it was built from a different grammar or different dictionaries."""
+    try:
+        with open(table_file, "rb") as fin:
+            if pickle.load(fin) != (grammar_version(), lexicon_version()):
+                log_error("WARNING: %s is out of date, so not used. Rebuild it with --build-frequent." % table_file)
+                return {}
+            return pickle.load(fin)
+    except Exception:    # missing or unreadable: do without
+        return {}
+
+def parse_order(parse):
+    "Sort key for parses: by cost, with ties broken the same way every time."
+    return (parse["cost"] if "cost" in parse else 0, sorted(parse.items()))
+
 @lru_cache(maxsize=1000)
 def fullparse(word, top=3, guess=True): 
     """
@@ -632,6 +941,53 @@ def fullparse(word, top=3, guess=True):
             high confidence; XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
             indicates low confidence and a guessed stem with no dictionary hit. 
     """
+    return _fullparse_words([word], top, guess)[word]
+
+def fullparse_many(words, top=3, guess=True):
+    """
+    Parses a sequence of Ge'ez words, e.g. the tokens of a document, and returns a 
+    list with fullparse(word, top, guess) for each of them, in the same order. 
+    
+    Each distinct word is transliterated and parsed only once, however often it 
+    occurs, and the results don't go through (or push words out of) fullparse()'s cache;
+    so on running text this costs about as much as parsing its vocabulary. Words that 
+    occur more than once share the same list of parses.
+    """
+    words = list(words)
+    parses = _fullparse_words(words, top, guess)
+    if ENGINE.parse_cache is not None:
+        ENGINE.parse_cache.commit()
+    return [ parses[word] for word in words ]
+
+def _fullparse_words(words, top=3, guess=True):
+    """{word: _fullparse(word, top, guess)} for the distinct words: from the table of 
+    frequent words if they're in it, else from the parse cache if it's open."""
+    words = set(words)
+    parses = {}
+    if guess:    # the table has every parse of its words, guesses included
+        for word in words:
+            rows = ENGINE.frequent.get(word)
+            if rows is not None:
+                parses[word] = [ parse_from_row(row) for row in (rows[:top] if top else rows) ]
+        words.difference_update(parses)
+    cache = ENGINE.parse_cache
+    if cache is None:
+        for word in words:
+            parses[word] = _fullparse(word, top, guess)
+        return parses
+    keys = dict( (word, "%s\t%d\t%d" % (word, top, guess)) for word in words )
+    rows = cache.get_many(keys.values())
+    new_rows = []
+    for word, key in keys.items():
+        if key in rows:
+            parses[word] = [ parse_from_row(row) for row in rows[key] ]
+        else:
+            parses[word] = _fullparse(word, top, guess)
+            new_rows.append( (key, [ parse_to_row(p) for p in parses[word] ]) )
+    cache.put_many(new_rows)
+    return parses
+
+def _fullparse(word, top=3, guess=True):
     word = word.replace(r"\x94","").replace(r"\x93","")   # get rid of curly quotation marks. 
 
     # Check if input is in roman characters. 
@@ -650,24 +1006,25 @@ def fullparse(word, top=3, guess=True):
     if isascii:  # input is ASCII char. Word itself, empty definition/cost 
         parses = [ make_trivial_parse(word, word, word, word, "", "") ]
 
-    elif ipa in l1_to_l2:    # whole word form found in dict file somewhere,
+    elif ipa in ENGINE.l1_to_l2:    # whole word form found in dict file somewhere,
                              # including some 1-char prepositions. 
-        parses = PARSER.parse(ipa)
+        parses = parse_ipa(ipa, top, guess)
         # reduce cost of whole-word parse if found in dictionary
         # these are essentially full-dictionary words.
         # some full-dictionary words come out ranked lower than analyzed out,
         # because Lookup routine has only local visibility during each parse step.
         # ስደተኛታት sɨdətəɲatat 'migrants' vs. 'multiple refugee' ("sɨdətəɲa-tat")
-        for p in parses: 
+        # parses are immutable, so the reduced ones are copies.
+        for i, p in enumerate(parses): 
             if g2pp(word) == p["breakdown"] and p["definition"] != "":
                 original_cost = p["cost"]
-                p["cost"] = original_cost[:-2]    # take off 2. should be just enough. 
+                parses[i] = p.with_value("cost", Cost.typ(max(original_cost - 2, 0)))    # take off 2. should be just enough. 
     elif len(word) == 1:     # 1-char input not in dict: likely acronym, return IPA.
         pass                 # taken care of later
-    elif ipa in preparsed:   # word is found in preparsed. just look it up.  
-        parses = preparsed[ipa]
+    elif ipa in ENGINE.preparsed:   # word is found in preparsed. just look it up.  
+        parses = ENGINE.preparsed[ipa]
     else:                    # parse away!  
-        parses = PARSER.parse(ipa)
+        parses = parse_ipa(ipa, top, guess)
 
     if not guess and not isascii:  # guess is turned off, and input is not ASCII. 
         # filter out guessed roots. Horn morpho's guess will also be thrown out.  
@@ -677,9 +1034,9 @@ def fullparse(word, top=3, guess=True):
         # print("Warning: cannot parse %s (%s)" % (word, ipa))
         parses = [ make_trivial_parse(ipa_out, ipa_out, ipa_out, ipa_out, "", "") ]        
        
-    parses.sort(key=lambda x:len(x["cost"]) if "cost" in x else 0)
-    if top: return parses[:top]
-    else: return parses
+    parses.sort(key=parse_order)
+    if top: parses = parses[:top]
+    return [ render_cost(p) for p in parses ]
 
 @lru_cache(maxsize=1000)
 def best_fullparse(word):
@@ -758,6 +1115,7 @@ sample_text = "ካብቲ ንበልዖ መግብን ንሰትዮ ማይን ጀሚ
 # for w in sample_text.split(): jsonprint(fullparse(w))
 # for w in sample_text.split(): jsonprint(fullparse(w, top=0))
 # for w in sample_text.split(): jsonprint(fullparse(w, top=0, guess=False))
+# jsonprint(fullparse_many(sample_text.split()))
 
 
 
@@ -772,6 +1130,15 @@ sample_text = "ካብቲ ንበልዖ መግብን ንሰትዮ ማይን ጀሚ
 if __name__ == '__main__':
     # just for testing.  to use this file, import it as a library and call parse()
 
+    if "--build-lexicon" in sys.argv:    # force a rebuild of the lexicon cache
+        load_lexicons(rebuild=True)
+        sys.exit(0)
+
+    if "--build-frequent" in sys.argv:   # --build-frequent FREQ_LIST [N]: see build_frequent_table()
+        args = sys.argv[sys.argv.index("--build-frequent")+1:]
+        build_frequent_table(args[0], int(args[1]) if len(args) > 1 else 20000)
+        sys.exit(0)
+
     jsonprint(fullparse(sample[0]))
 
     for w in sample_text.split(): jsonprint(parse(w, 'lemma'))
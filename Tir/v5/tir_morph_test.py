@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Checks that morpar.GrammarOptimizer leaves what tir_morph's grammar parses unchanged:
+# the grammar is built without optimizing it, used on a fixed word list, and then
+# optimized and used on the words again.
+
+from __future__ import unicode_literals
+from __future__ import print_function
+from io import open
+import os
+import morpar
+
+morpar.OPTIMIZER.optimize = lambda parser: parser    # so that importing tir_morph leaves PARSER alone
+import tir_morph
+del morpar.OPTIMIZER.optimize
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "benchmarks", "tir.txt")
+
+def parse_all(parser, words):
+    return [ set(parser.parse(tir_morph.g2p(word))) for word in words ]
+
+
+#############################
+#
+# START TESTS
+#
+#############################
+
+print("STARTING GRAMMAR OPTIMIZER TEST")
+
+with open(CORPUS, "r", encoding="utf-8") as fin:
+    words = sorted(set(fin.read().split()))
+words += tir_morph.sample_text.split() + tir_morph.sample
+tir_morph.ENGINE.load()
+before = parse_all(tir_morph.PARSER, words)
+parser = morpar.OPTIMIZER.optimize(tir_morph.PARSER)
+print(morpar.OPTIMIZER.report())
+after = parse_all(parser, words)
+for word, old, new in zip(words, before, after):
+    assert old == new, word
+print("%d words, %d parses, all the same" % (len(words), sum(len(p) for p in before)))
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Times the Tigrinya parser on a list of tokens (by default, the words of
+# tir_morph.sample_text), bypassing the fullparse() cache so every repetition
+# does the full work.  Reports seconds per token and, where tracemalloc is
+# available, the peak memory traced while parsing.  With --profile, runs
+# under cProfile instead and reports how much of the time goes to hashing
+# and comparing channel maps (HashableDict) and channels.  With --nodes,
+# reports the time by grammar layer instead (see morpar.Profiler), and with
+# --collapsed, also writes it out for a flame graph tool.
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from io import open
+import argparse, time, cProfile, pstats
+from tir_morph import *
+import tir_morph
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+def clear_caches():
+    # The grammar's parsers are memoized; clear them so that each
+    # repetition measures parsing rather than cache lookups.
+    fullparse.cache_clear()
+    p2pp.cache_clear()
+    MEMO.clear()
+
+def time_tokens(tokens, repeat=5):
+    if tracemalloc:
+        tracemalloc.start()
+    start = time.time()
+    for i in range(repeat):
+        clear_caches()
+        for token in tokens:
+            fullparse(token)
+    elapsed = time.time() - start
+    allocated = None
+    if tracemalloc:
+        allocated = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return elapsed, allocated
+
+def profile_tokens(tokens, repeat=5, top=15):
+    profiler = cProfile.Profile()
+    profiler.runcall(time_tokens, tokens, repeat)
+    stats = pstats.Stats(profiler)
+    total = stats.total_tt
+    hashing = 0.0
+    stats.sort_stats("tottime").print_stats(top)
+    for (filename, line, name), stat in sorted(stats.stats.items()):
+        if filename.endswith("morpar.py") and name in ("__hash__", "__eq__", "__ne__"):
+            print("morpar.py:%d(%s): %d calls, %.3f s" % (line, name, stat[1], stat[3]))
+            hashing += stat[3]    # cumulative time
+    print("hashing/equality of channel maps and channels: %.3f s of %.3f s (%.1f%%)" % (hashing, total, 100.0 * hashing / total))
+
+def profile_nodes(tokens, repeat=5, collapsed_file=None):
+    PROFILER.label(vars(tir_morph))
+    PROFILER.reset()
+    PROFILER.enable()
+    try:
+        time_tokens(tokens, repeat)
+    finally:
+        PROFILER.disable()
+    print(PROFILER.report())
+    if collapsed_file:
+        with open(collapsed_file, "w", encoding="utf-8") as fout:
+            fout.write(PROFILER.collapsed())
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("input", nargs="?", help="A file of whitespace-separated tokens in Ge'ez script (default: sample_text)")
+    argparser.add_argument("--repeat", type=int, default=5, help="Number of passes over the tokens")
+    argparser.add_argument("--profile", action="store_true", help="Profile, and report the share of time spent hashing channel maps")
+    argparser.add_argument("--nodes", action="store_true", help="Report the time spent in each layer of the grammar")
+    argparser.add_argument("--collapsed", help="With --nodes, a file to write the time by call path to, for flamegraph.pl or speedscope")
+    args = argparser.parse_args()
+
+    if args.input:
+        with open(args.input, "r", encoding="utf-8") as fin:
+            tokens = fin.read().split()
+    else:
+        tokens = sample_text.split()
+
+    ENGINE.load()    # don't count building the dictionaries
+    ENGINE.frequent = {}    # and parse every token, even if it has precomputed parses
+
+    if args.profile:
+        profile_tokens(tokens, args.repeat)
+        sys.exit(0)
+
+    if args.nodes:
+        profile_nodes(tokens, args.repeat, args.collapsed)
+        sys.exit(0)
+
+    MEMO.reset_counters()
+    elapsed, allocated = time_tokens(tokens, args.repeat)
+    n = len(tokens) * args.repeat
+    print("%d tokens in %.3f s: %.2f ms/token" % (n, elapsed, elapsed * 1000 / n))
+    print("memo: %(hits)d hits, %(misses)d misses, %(clears)d clears" % MEMO.stats())
+    print(OPTIMIZER.report())
+    if allocated is not None:
+        print("peak traced memory: %.1f KiB" % (allocated / 1024.0))
@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Benchmarks the morphological parsers on the fixed token corpora in benchmarks/,
+# and compares the results with a stored baseline.
+#
+#    python benchmark.py                        # all parsers; compare with benchmarks/baseline.json
+#    python benchmark.py tir_morph --repeat 5
+#    python benchmark.py --save-baseline        # make these results the new baseline
+#
+# Each parser is run in a process of its own, so that its start-up time and memory
+# use aren't mixed up with another's.  For each it reports:
+#
+#    import_s      seconds to import the module
+#    load_s        seconds to load its resources (dictionaries etc.) and parse a first token
+#    tokens_per_s  parsing speed once loaded: each distinct token of the corpus is parsed
+#                  from scratch, with every cache and memo emptied before it
+#    p50_ms        median time to parse a token from scratch
+#    p99_ms        99th percentile time to parse a token from scratch
+#    cached_tokens_per_s
+#                  speed on the whole corpus, repeated tokens and all, through the parser's
+#                  cached entry point (e.g. fullparse()), with the caches emptied before each pass
+#    peak_rss_kib  peak resident memory of the process
+#    caches        hits and misses of the parser's caches over the from-scratch parses, and
+#                  how many transliterations the syllable table did (see translit.py)
+#
+# Persistent parse caches and the Tigrinya table of frequent words are left out, so
+# that the grammar and engine do all the work.  The results are written as JSON
+# (benchmarks/results.json by default); any timing or memory figure more than
+# --tolerance worse than the baseline's is reported as a regression, and makes
+# the exit status 1.
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from io import open
+import argparse, json, os, platform, subprocess, sys, time
+
+from corpus_runner import MODULE_DIRS
+
+try:
+    import resource
+except ImportError:    # not on Windows
+    resource = None
+
+BENCH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks")
+
+# lower is better for all of these except tokens_per_s
+METRICS = ["import_s", "load_s", "tokens_per_s", "p50_ms", "p99_ms", "cached_tokens_per_s", "peak_rss_kib"]
+HIGHER_IS_BETTER = set(["tokens_per_s", "cached_tokens_per_s"])
+
+def log_error(*args, **kwargs):
+    print(*args, file=sys.stderr, **kwargs)
+
+######################################
+#
+# LANGUAGES
+#
+# For each parser, a class that loads it,
+# parses one token from scratch or through
+# its caches, empties its caches and memos,
+# and reports on them.
+#
+######################################
+
+def hit_rate(hits, misses):
+    return { "hits": hits, "misses": misses,
+             "hit_rate": round(hits * 1.0 / (hits + misses), 4) if hits + misses else None }
+
+class TirBench(object):
+    def load(self, module):
+        self.module = module
+        module.ENGINE.load()
+        module.ENGINE.frequent = {}    # parse every token, even if it has precomputed parses
+
+    def parse(self, token):
+        return self.module._fullparse(token)
+
+    def parse_cached(self, token):
+        return self.module.fullparse(token)
+
+    def clear(self):
+        self.module.fullparse.cache_clear()
+        self.module.p2pp.cache_clear()
+        self.module.MEMO.clear()
+        self.module.ENGINE.g2p.memo.clear()
+        self.module.ENGINE.g2pp.memo.clear()
+
+    def reset_counters(self):
+        self.module.MEMO.reset_counters()
+        self.module.ENGINE.g2p.reset_counters()
+
+    def caches(self):
+        memo = self.module.MEMO.stats()
+        g2p = self.module.ENGINE.g2p.stats()
+        return { "memo": hit_rate(memo["hits"], memo["misses"]),
+                 "g2p_table": hit_rate(g2p["table"], g2p["epitran"]) }
+
+class OrmBench(object):
+    def load(self, module):
+        self.module = module
+
+    def parse(self, token):
+        return self.module._full_parses(self.module.normalize(token))
+
+    def parse_cached(self, token):
+        return self.module.full_parses(token)
+
+    def clear(self):
+        self.module.full_parses.cache_clear()
+        self.module.MEMO.clear()
+
+    def reset_counters(self):
+        self.module.MEMO.reset_counters()
+
+    def caches(self):
+        memo = self.module.MEMO.stats()
+        return { "memo": hit_rate(memo["hits"], memo["misses"]) }
+
+class AmhBench(object):
+    def load(self, module):
+        self.module = module
+        self.g2p = module.get_g2p("amh-Ethi")
+        # the grammar's memoized parsers; the others (dictionary etc.) are loaded once
+        self.memos = [ m for m in module.memoized.instances if m.func is not None and m.maxsize is not None ]
+
+    def parse(self, token):
+        return self.module.PARSER.parse(self.g2p(token))
+
+    parse_cached = parse    # its caches are the memos, kept for the rest of the pass
+
+    def clear(self):
+        for m in self.memos:
+            m.cache_clear()
+        self.g2p.memo.clear()
+
+    def reset_counters(self):
+        for m in self.memos:
+            m.hits = m.misses = 0
+        self.g2p.reset_counters()
+
+    def caches(self):
+        return { "memo": hit_rate(sum(m.hits for m in self.memos), sum(m.misses for m in self.memos)),
+                 "g2p_table": hit_rate(self.g2p.table_hits, self.g2p.fallbacks) }
+
+LANGUAGES = {
+    "amh_morph": AmhBench,
+    "orm_morph": OrmBench,
+    "tir_morph": TirBench,
+}
+
+######################################
+#
+# MEASURING ONE PARSER
+#
+# Done in a child process (see --worker),
+# which prints its results as JSON.
+#
+######################################
+
+def read_tokens(module_name):
+    filename = os.path.join(BENCH_DIR, module_name.split("_")[0] + ".txt")
+    with open(filename, "r", encoding="utf-8") as fin:
+        return fin.read().split()
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100.0))]
+
+def peak_rss_kib():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak    # bytes on macOS, KiB elsewhere
+
+def measure(module_name, repeat):
+    tokens = read_tokens(module_name)
+    bench = LANGUAGES[module_name]()
+    module_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), MODULE_DIRS[module_name])
+    os.chdir(module_dir)    # some parsers read their data files relative to it
+    sys.path.insert(0, module_dir)
+
+    start = time.time()
+    module = __import__(module_name)
+    imported = time.time()
+    bench.load(module)
+    bench.parse(tokens[0])
+    loaded = time.time()
+
+    # Each distinct token from scratch: on the corpus as it stands, most tokens are
+    # repeats, which the caches would answer without parsing anything.
+    types = sorted(set(tokens))
+    bench.reset_counters()
+    latencies = []
+    for i in range(repeat):
+        for token in types:
+            bench.clear()
+            t = time.time()
+            bench.parse(token)
+            latencies.append(time.time() - t)
+    caches = bench.caches()
+
+    cached = 0.0
+    for i in range(repeat):
+        bench.clear()
+        t = time.time()
+        for token in tokens:
+            bench.parse_cached(token)
+        cached += time.time() - t
+
+    return { "tokens": len(tokens),
+             "types": len(types),
+             "repeat": repeat,
+             "import_s": round(imported - start, 4),
+             "load_s": round(loaded - imported, 4),
+             "tokens_per_s": round(len(latencies) / sum(latencies), 2),
+             "p50_ms": round(percentile(latencies, 50) * 1000, 4),
+             "p99_ms": round(percentile(latencies, 99) * 1000, 4),
+             "cached_tokens_per_s": round(len(tokens) * repeat / cached, 2),
+             "peak_rss_kib": peak_rss_kib(),
+             "caches": caches }
+
+def run_worker(module_name, repeat):
+    "Runs measure() in a fresh process, and returns its results."
+    command = [ sys.executable, os.path.abspath(__file__), "--worker", module_name, "--repeat", str(repeat) ]
+    output = subprocess.check_output(command)
+    return json.loads(output.decode("utf-8").strip().splitlines()[-1])
+
+######################################
+#
+# RESULTS AND BASELINE
+#
+######################################
+
+def git_commit():
+    try:
+        output = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                         cwd=os.path.dirname(os.path.abspath(__file__)),
+                                         stderr=open(os.devnull, "wb"))
+        return output.decode("utf-8").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline, tolerance):
+    "Prints each figure beside the baseline's; returns the list of regressions."
+    regressions = []
+    for module_name, current in sorted(results["parsers"].items()):
+        print("%s (baseline %s)" % (module_name, baseline.get("commit")))
+        base = baseline["parsers"].get(module_name)
+        if base is None:
+            print("    not in the baseline")
+            continue
+        for metric in METRICS:
+            old, new = base.get(metric), current.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) * 1.0 / old
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            flag = ""
+            if worse > tolerance:
+                flag = "  REGRESSION"
+                regressions.append((module_name, metric))
+            print("    %-19s %12s %12s %+7.1f%%%s" % (metric, old, new, change * 100, flag))
+        for cache, stats in sorted(current.get("caches", {}).items()):
+            old = base.get("caches", {}).get(cache, {}).get("hit_rate")
+            print("    %-19s %12s %12s" % (cache + " hits", old, stats["hit_rate"]))
+    return regressions
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("modules", nargs="*", help="The parsers to benchmark: %s (default: all)" % ", ".join(sorted(LANGUAGES)))
+    argparser.add_argument("--repeat", type=int, default=3, help="Number of timed passes over the corpus")
+    argparser.add_argument("--output", default=os.path.join(BENCH_DIR, "results.json"), help="Where to write the results")
+    argparser.add_argument("--baseline", default=os.path.join(BENCH_DIR, "baseline.json"), help="The results to compare with")
+    argparser.add_argument("--save-baseline", action="store_true", help="Store these results as the baseline")
+    argparser.add_argument("--tolerance", type=float, default=0.10, help="How much worse a figure can get before it counts as a regression (default: 0.10)")
+    argparser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = argparser.parse_args()
+    for module_name in args.modules:
+        if module_name not in LANGUAGES:
+            argparser.error("unknown parser %s" % module_name)
+
+    if args.worker:
+        print(json.dumps(measure(args.worker, args.repeat)))
+        sys.exit(0)
+
+    results = { "commit": git_commit(),
+                "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "parsers": {} }
+    for module_name in args.modules or sorted(LANGUAGES):
+        log_error("Benchmarking %s" % module_name)
+        results["parsers"][module_name] = run_worker(module_name, args.repeat)
+    with open(args.output, "w", encoding="utf-8") as fout:
+        fout.write("%s\n" % json.dumps(results, indent=2, sort_keys=True))
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, "r", encoding="utf-8") as fin:
+            regressions = compare(results, json.loads(fin.read()), args.tolerance)
+    else:
+        print(json.dumps(results, indent=2, sort_keys=True))
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as fout:
+            fout.write("%s\n" % json.dumps(results, indent=2, sort_keys=True))
+        log_error("Saved baseline %s" % args.baseline)
+    sys.exit(1 if regressions else 0)
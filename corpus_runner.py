@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Parses a corpus with one of the morphological parsers, using a pool of processes.
+#
+#    python corpus_runner.py tir_morph "/path/to/corpus/*.txt" /path/to/output --jobs 16
+#
+# The input files are read in chunks of lines, which the worker processes parse as they
+# become free; each worker loads the parser once.  The output is written in input order,
+# one file per input file and format, named like process_amh.py's (e.g. "doc1.lemma.tir"
+# for doc1.txt); inputs from different directories get the same subdirectories in the
+# output directory.  The formats are:
+#
+#    lemma  the lemma of each token's best parse, space-separated
+#    gloss  the gloss of each token's best parse, split into morphemes, space-separated
+#    json   each token's best parse, as a JSON list per line
+#
+# With --cache, parses are also kept in (and taken from) a parse cache file, which any
+# number of runs can share; see parse_cache.py.
+#
+# After every chunk, how far each file has got is saved in a .progress file in the output
+# directory, so that if a run is interrupted, running it again carries on from there.
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from io import open
+import argparse, glob, json, multiprocessing, os, signal, sys
+
+# Where the parsers live, relative to this file.  Each is run from its own directory,
+# since some of them read their data files relative to it.
+MODULE_DIRS = {
+    "amh_morph": os.path.join("Amh", "v0_8", "v0_8"),
+    "orm_morph": os.path.join("Orm", "v4"),
+    "tir_morph": os.path.join("Tir", "v5"),
+}
+
+def log_error(*args, **kwargs):
+    print(*args, file=sys.stderr, **kwargs)
+
+######################################
+#
+# LANGUAGES
+#
+# For each parser, a function from a
+# list of distinct tokens to a list of
+# (best parse, fallback) pairs, where
+# the fallback stands in for a missing
+# lemma or gloss.
+#
+######################################
+
+def amh_best_parses(module):
+    g2p = module.get_g2p("amh-Ethi")
+    def best_parses(tokens):
+        results = []
+        for ipa in g2p.transliterate_many(tokens):
+            parses = list(module.PARSER.parse(ipa))
+            parses.sort(key=lambda x:len(x["cost"]) if "cost" in x else 0)
+            results.append((parses[0] if parses else {}, ipa))
+        return results
+    return best_parses
+
+def orm_best_parses(module):
+    def best_parses(tokens):
+        results = []
+        for token in tokens:
+            parses = module.full_parses(token)
+            results.append((parses[0] if parses else {}, token))
+        if module.PARSE_CACHE is not None:
+            module.PARSE_CACHE.commit()
+        return results
+    return best_parses
+
+def tir_best_parses(module):
+    module.ENGINE.load()
+    def best_parses(tokens):
+        return [ (parses[0], token) for token, parses in zip(tokens, module.fullparse_many(tokens, top=1)) ]
+    return best_parses
+
+LANGUAGES = {
+    "amh_morph": amh_best_parses,
+    "orm_morph": orm_best_parses,
+    "tir_morph": tir_best_parses,
+}
+
+######################################
+#
+# OUTPUT FORMATS
+#
+# Each takes a line's list of (parse,
+# fallback) pairs and returns its line
+# of output.
+#
+######################################
+
+def format_lemma(parses):
+    lemmas = []
+    for parse, fallback in parses:
+        if "lemma" not in parse or not parse["lemma"]:
+            lemmas.append(fallback)
+        else:
+            lemmas.append(parse["lemma"].replace(" ",""))
+    return " ".join(lemmas) + "\n"
+
+def format_gloss(parses):
+    gloss = []
+    for parse, fallback in parses:
+        if "gloss" not in parse or not parse["gloss"]:
+            gloss.append(fallback)
+        else:
+            gloss += parse["gloss"].replace(" ","").split("-")
+    return " ".join(gloss) + "\n"
+
+def format_json(parses):
+    results = []
+    for parse, fallback in parses:
+        result = {}
+        for channel, value in parse.items():
+            if channel == "cost" and isinstance(value, int):   # numeric costs are shown as X's
+                value = "X" * value
+            result[channel] = "%s" % value
+        results.append(result)
+    return json.dumps(results, ensure_ascii=False, sort_keys=True) + "\n"
+
+FORMATS = {
+    "lemma": format_lemma,
+    "gloss": format_gloss,
+    "json": format_json,
+}
+
+######################################
+#
+# WORKERS
+#
+######################################
+
+best_parses = None    # set in each worker by load_parser()
+formats = None
+
+def load_parser(module_name, module_dir, output_formats, cache_file=None):
+    global best_parses, formats
+    if best_parses is None:
+        os.chdir(module_dir)
+        sys.path.insert(0, module_dir)
+        module = __import__(module_name)
+        if cache_file:
+            module.open_parse_cache(cache_file)
+        best_parses = LANGUAGES[module_name](module)
+    formats = output_formats
+
+def init_worker(*args):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)    # leave interrupts to the parent
+    load_parser(*args)
+
+def parse_chunk(task):
+    "(file index, lines) --> (file index, number of lines, {format: output text})"
+    index, lines = task
+    lines = [ line.split() for line in lines ]
+    types = list(set(token for tokens in lines for token in tokens))
+    best = dict(zip(types, best_parses(types)))
+    outputs = {}
+    for name in formats:
+        outputs[name] = "".join(FORMATS[name]([best[token] for token in tokens]) for tokens in lines)
+    return index, len(lines), outputs
+
+######################################
+#
+# OUTPUT FILES AND PROGRESS
+#
+######################################
+
+def output_stems(input_filenames):
+    ''' The name of each input file's output files, less the format and suffix: its path
+        relative to the directory all the inputs are in, without its extension. '''
+    dirs = [ os.path.dirname(filename).split(os.sep) for filename in input_filenames ]
+    common = 0
+    while dirs and all(len(d) > common and d[common] == dirs[0][common] for d in dirs):
+        common += 1
+    return [ os.path.join(*(d[common:] + [os.path.splitext(os.path.basename(filename))[0]]))
+             for d, filename in zip(dirs, input_filenames) ]
+
+class OutputFiles(object):
+    ''' The output files for one input file, and how far they have got: the number of input
+        lines done, and the size of each output file when they were, so that anything
+        written after that (by a run that was interrupted) can be thrown away. '''
+
+    def __init__(self, input_filename, output_dir, stem, formats, suffix):
+        self.input_filename = input_filename
+        self.paths = dict((name, os.path.join(output_dir, "%s.%s.%s" % (stem, name, suffix)))
+                          for name in formats)
+        self.progress_path = os.path.join(output_dir, stem + ".progress")
+        self.lines = 0
+        self.offsets = {}
+        self.done = False
+        self.files = None
+        if os.path.exists(self.progress_path):
+            with open(self.progress_path, "r", encoding="utf-8") as fin:
+                progress = json.loads(fin.read())
+            if sorted(progress["offsets"]) == sorted(formats):    # else start again
+                self.lines, self.offsets, self.done = progress["lines"], progress["offsets"], progress["done"]
+
+    def open(self):
+        if self.lines:
+            log_error("Resuming %s from line %d" % (self.input_filename, self.lines + 1))
+        else:
+            log_error("Processing %s" % self.input_filename)
+        if not os.path.isdir(os.path.dirname(self.progress_path)):
+            os.makedirs(os.path.dirname(self.progress_path))
+        self.files = {}
+        for name, path in self.paths.items():
+            fout = open(path, "ab")
+            fout.truncate(self.offsets.get(name, 0))
+            self.files[name] = fout
+
+    def write(self, n_lines, outputs, last):
+        if self.files is None:
+            self.open()
+        for name, text in outputs.items():
+            self.files[name].write(text.encode("utf-8"))
+            self.files[name].flush()
+            self.offsets[name] = self.files[name].tell()
+        self.lines += n_lines
+        self.done = last
+        self.save_progress()
+        if last:
+            for fout in self.files.values():
+                fout.close()
+            log_error("Finished %s (%d lines)" % (self.input_filename, self.lines))
+
+    def save_progress(self):
+        progress = {"lines": self.lines, "offsets": self.offsets, "done": self.done}
+        tmp_path = self.progress_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fout:
+            fout.write("%s" % json.dumps(progress))
+        os.rename(tmp_path, self.progress_path)
+
+def read_chunks(outputs, chunk_size):
+    ''' Yields (file index, lines) tasks for the lines not yet done.  The last chunk of
+        each file is shorter than chunk_size (if need be, empty), which marks its end. '''
+    for index, output in enumerate(outputs):
+        if output.done:
+            continue
+        with open(output.input_filename, "r", encoding="utf-8") as fin:
+            chunk = []
+            for n, line in enumerate(fin):
+                if n < output.lines:
+                    continue
+                chunk.append(line)
+                if len(chunk) == chunk_size:
+                    yield index, chunk
+                    chunk = []
+            yield index, chunk
+
+def ordered_results(pool, tasks):
+    ''' The results of parse_chunk on each task, in order.  (Waiting with a timeout, since
+        under Python 2 a plain wait can't be interrupted with Ctrl-C.) '''
+    results = pool.imap(parse_chunk, tasks)
+    while True:
+        try:
+            yield results.next(timeout=86400)
+        except StopIteration:
+            return
+
+def run(module_name, input_filenames, output_dir, output_formats, jobs, chunk_size, cache_file=None):
+    suffix = module_name.split("_")[0]
+    outputs = [ OutputFiles(filename, output_dir, stem, output_formats, suffix)
+                for filename, stem in zip(input_filenames, output_stems(input_filenames)) ]
+    module_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), MODULE_DIRS[module_name])
+
+    # Load the parser here first, so that forked workers start with it already loaded.
+    load_parser(module_name, module_dir, output_formats, cache_file)
+    pool = None
+    if jobs > 1:
+        pool = multiprocessing.Pool(jobs, init_worker, (module_name, module_dir, output_formats, cache_file))
+        results = ordered_results(pool, read_chunks(outputs, chunk_size))
+    else:
+        results = (parse_chunk(task) for task in read_chunks(outputs, chunk_size))
+    try:
+        for index, n_lines, text in results:
+            outputs[index].write(n_lines, text, n_lines < chunk_size)
+    finally:
+        if pool:
+            pool.terminate()
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("module", choices=sorted(LANGUAGES), help="The parser to use")
+    argparser.add_argument("input", help="A glob of input files, one sentence per line, tokens separated by whitespace")
+    argparser.add_argument("outputDir", help="A directory to hold the output files")
+    argparser.add_argument("--format", action="append", choices=sorted(FORMATS), help="An output format; can be given more than once (default: lemma and gloss)")
+    argparser.add_argument("--jobs", type=int, default=multiprocessing.cpu_count(), help="Number of worker processes (default: one per CPU)")
+    argparser.add_argument("--chunk", type=int, default=200, help="Number of lines sent to a worker at a time")
+    argparser.add_argument("--cache", help="A parse cache file (SQLite) to share parses with other runs; not for amh_morph")
+    args = argparser.parse_args()
+    if args.cache and args.module == "amh_morph":
+        argparser.error("amh_morph has no parse cache")
+
+    input_filenames = sorted(os.path.abspath(filename) for filename in glob.glob(args.input))
+    stems = output_stems(input_filenames)
+    clashes = sorted(filename for filename, stem in zip(input_filenames, stems) if stems.count(stem) > 1)
+    if clashes:
+        argparser.error("these input files would have the same output files: %s" % ", ".join(clashes))
+    output_dir = os.path.abspath(args.outputDir)
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    cache_file = os.path.abspath(args.cache) if args.cache else None
+    run(args.module, input_filenames, output_dir, args.format or ["lemma", "gloss"], args.jobs, args.chunk, cache_file)